@@ -0,0 +1,223 @@
+"""
+Benchmarks for the game backend
+"""
+
+import copy
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from game.ChessGame import ChessGame, QUERY_CACHE, validateMoves
+from game.SearchAI import SearchAI
+
+OPENING = ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Nf6']
+# Budgets in seconds for a fresh process, checked by benchmarkStartup()
+IMPORT_BUDGET = 0.05
+FIRST_MOVE_BUDGET = 0.01
+
+# A quiet game for the allocation benchmark, every move has to be valid
+GAME = OPENING + ['d3', 'Bc5', 'O-O', 'd6', 'c3', 'O-O', 'Re1', 'a6', 'Bb3', 'Ba7', 'h3', 'h6',
+    'Nbd2', 'Re8', 'Nf1', 'Be6', 'Bxe6', 'Rxe6', 'Ng3', 'd5']
+
+CANDIDATES = ['d3', 'd4', 'Nc3', 'O-O', 'Kf1', 'Qe2', 'Bxf7', 'Ng5', 'a3', 'Ra2', 'Qh8', 'e5']
+
+def playOpening(moves):
+  """
+  Create a game and play the given moves
+  Input:
+    moves: List of String
+  Return:
+    Object of class ChessGame
+  """
+  game = ChessGame()
+  for fide_str in moves:
+    game.move(fide_str)
+  return game
+
+def benchmarkBatchValidation(num_games=20):
+  """
+  Compare validateMoves() against one copy and move() per candidate
+  Input:
+    num_games: Int
+  Return:
+  """
+  # Without the query cache, so that only the work shared by the batch counts
+  max_entries = QUERY_CACHE.max_entries
+  QUERY_CACHE.max_entries = 0
+  QUERY_CACHE.clear()
+  games = [playOpening(OPENING) for _ in range(num_games)]
+  pairs = [(game, fide_str) for game in games for fide_str in CANDIDATES]
+  start = time.perf_counter()
+  single_results = []
+  for game, fide_str in pairs:
+    single_results.append(copy.deepcopy(game).move(fide_str))
+  single_time = time.perf_counter() - start
+  start = time.perf_counter()
+  batch_results = validateMoves(pairs)
+  batch_time = time.perf_counter() - start
+  QUERY_CACHE.max_entries = max_entries
+  assert single_results == [retval for retval, _ in batch_results]
+  print('batch validation: %d moves, per-call %.3fs, batch %.3fs (%.1fx)'
+      % (len(pairs), single_time, batch_time, single_time / batch_time))
+
+def benchmarkParallelSearch(depth=3):
+  """
+  Report nodes per second and speedup of the search for a growing number of processes
+  Input:
+    depth: Int
+  Return:
+  """
+  game = playOpening(OPENING)
+  base_time = None
+  processes = 1
+  while processes <= max(multiprocessing.cpu_count(), 1):
+    ai = SearchAI(depth=depth, processes=processes)
+    try:
+      ai.getMove(game)
+    finally:
+      ai.close()
+    if base_time is None:
+      base_time = ai.stats['time']
+    print('parallel search: %2d processes, %6d nodes, %8.0f nodes/s, %.2fs (%.2fx)'
+        % (processes, ai.stats['nodes'], ai.stats['nodes_per_second'], ai.stats['time'],
+          base_time / ai.stats['time']))
+    processes *= 2
+
+def benchmarkStartup(runs=5):
+  """
+  Measure the import time of the game module and the latency of the first move
+  in fresh processes, and fail if the best run exceeds the budgets
+  Input:
+    runs: Int
+  Return:
+  """
+  script = ("import time\n"
+      "start = time.perf_counter()\n"
+      "from game.ChessGame import ChessGame\n"
+      "imported = time.perf_counter()\n"
+      "ChessGame().move('e4')\n"
+      "print(imported - start, time.perf_counter() - imported)\n")
+  timings = []
+  for _ in range(runs):
+    output = subprocess.check_output([sys.executable, '-c', script],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    timings.append([float(value) for value in output.split()])
+  import_time = min(timing[0] for timing in timings)
+  first_move_time = min(timing[1] for timing in timings)
+  print('startup: import %.1fms (budget %.0fms), first move %.1fms (budget %.0fms)'
+      % (1000*import_time, 1000*IMPORT_BUDGET, 1000*first_move_time, 1000*FIRST_MOVE_BUDGET))
+  if import_time > IMPORT_BUDGET or first_move_time > FIRST_MOVE_BUDGET:
+    sys.exit('startup budget exceeded')
+
+def benchmarkQueryCache(num_games=10):
+  """
+  Play the same opening in several games while asking for the legal moves
+  and scores after every move, with and without the query cache
+  Input:
+    num_games: Int
+  Return:
+  """
+  max_entries = QUERY_CACHE.max_entries
+  timings = []
+  for budget in [0, max_entries]:
+    QUERY_CACHE.max_entries = budget
+    QUERY_CACHE.clear()
+    start = time.perf_counter()
+    for _ in range(num_games):
+      game = ChessGame()
+      for fide_str in OPENING + CANDIDATES[:3]:
+        game.getLegalMoves()
+        game.getScores()
+        game.move(fide_str)
+    timings.append(time.perf_counter() - start)
+  print('query cache: %d games, uncached %.3fs, cached %.3fs (%.1fx), hit rate %.0f%%'
+      % (num_games, timings[0], timings[1], timings[0] / timings[1],
+        100 * QUERY_CACHE.getStats()['hit_rate']))
+  QUERY_CACHE.max_entries = max_entries
+
+# Positions for the static exchange evaluation: FEN, capture and expected result
+SEE_POSITIONS = [
+  ('1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1', ((4, 0), (4, 4)), 1),
+  ('1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1', ((3, 2), (4, 4)), -2),
+  ('4k3/8/3p4/4p3/3P4/8/8/4K3 w - - 0 1', ((3, 3), (4, 4)), 0),
+  ('4k3/8/3p4/4p3/8/8/7Q/4K3 w - - 0 1', ((7, 1), (4, 4)), -8),
+  ('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2', ((4, 4), (3, 5)), 1),
+  ('3rk3/8/8/8/8/8/3p4/3RK3 w - - 0 1', ((3, 0), (3, 1)), 1),
+  ('3rk3/8/8/8/8/8/3p4/3R1K2 w - - 0 1', ((3, 0), (3, 1)), -4),
+  ('4r1k1/8/8/4p3/8/8/4R3/4R1K1 w - - 0 1', ((4, 1), (4, 4)), 1),
+]
+
+def benchmarkStaticExchange(repetitions=1000):
+  """
+  Check Board.staticExchange() on the SEE_POSITIONS and measure its speed
+  Input:
+    repetitions: Int
+  Return:
+  """
+  boards = []
+  for fen, move, expected in SEE_POSITIONS:
+    board = ChessGame(fen).board
+    result = board.staticExchange(move)
+    if result != expected:
+      sys.exit('static exchange of %s in %s is %d, expected %d' % (move, fen, result, expected))
+    boards.append((board, move))
+  start = time.perf_counter()
+  for _ in range(repetitions):
+    for board, move in boards:
+      board.staticExchange(move)
+  elapsed = time.perf_counter() - start
+  print('static exchange: %d positions correct, %.1fus per call'
+      % (len(boards), 1e6 * elapsed / (repetitions * len(boards))))
+
+def benchmarkMoveAllocations(num_games=50):
+  """
+  Count the memory blocks and bytes ChessGame.move() keeps alive per move and
+  the peak of its temporary allocations, with the query cache disabled
+  Input:
+    num_games: Int
+  Return:
+  """
+  max_entries = QUERY_CACHE.max_entries
+  QUERY_CACHE.max_entries = 0
+  QUERY_CACHE.clear()
+  games = [ChessGame() for _ in range(num_games)]
+  for fide_str in GAME:
+    # Warm up the lookup tables and the Zobrist keys outside of the measurement
+    ChessGame().move(fide_str)
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  peaks = 0
+  start = time.perf_counter()
+  for game in games:
+    for fide_str in GAME:
+      current = tracemalloc.get_traced_memory()[0]
+      tracemalloc.reset_peak()
+      if game.move(fide_str) == -1:
+        sys.exit('invalid move %s in the allocation benchmark' % fide_str)
+      peaks += tracemalloc.get_traced_memory()[1] - current
+  elapsed = time.perf_counter() - start
+  statistics = tracemalloc.take_snapshot().compare_to(before, 'filename')
+  tracemalloc.stop()
+  QUERY_CACHE.max_entries = max_entries
+  moves = num_games * len(GAME)
+  print('move allocations: %d moves, %.1f blocks and %.0f bytes retained per move, '
+      'peak %.0f bytes per move, %.1fus per move (traced)'
+      % (moves, sum(stat.count_diff for stat in statistics) / moves,
+        sum(stat.size_diff for stat in statistics) / moves, peaks / moves, 1e6 * elapsed / moves))
+
+BENCHMARKS = {
+  'allocations': benchmarkMoveAllocations,
+  'batch': benchmarkBatchValidation,
+  'cache': benchmarkQueryCache,
+  'parallel': benchmarkParallelSearch,
+  'see': benchmarkStaticExchange,
+  'startup': benchmarkStartup,
+}
+
+if __name__ == '__main__':
+  names = sys.argv[1:] or list(BENCHMARKS)
+  for name in names:
+    BENCHMARKS[name]()
@@ -0,0 +1,393 @@
+"""
+Differential fuzzing of the game backend: plays random games and compares
+the valid moves, check status and results of every ply against a simple
+reference move generator, which shares no code with the backend.
+Failures are shrunk to a minimal FEN and move sequence.
+
+Usage: python fuzz.py [games] [processes] [seed]
+"""
+
+import multiprocessing
+import random
+import sys
+import time
+
+from game.ChessGame import ChessGame, coordinatesToMove, moveToCoordinates
+
+KNIGHT_STEPS = [(1, 2), (2, 1), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1)]
+KING_STEPS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = KING_STEPS[:4]
+BISHOP_DIRECTIONS = KING_STEPS[4:]
+
+class ReferencePosition:
+  """Straightforward chess position: a list of 64 piece letters indexed by x + 8*y"""
+  def __init__(self, fen):
+    fields = fen.split()
+    self.board = ['.'] * 64
+    for row, row_str in enumerate(fields[0].split('/')):
+      x = 0
+      for char in row_str:
+        if char.isdigit():
+          x += int(char)
+        else:
+          self.board[x + 8*(7 - row)] = char
+          x += 1
+    self.white = fields[1] == 'w'
+    self.castling = set(fields[2].replace('-', ''))
+    self.en_passant = None if fields[3] == '-' else ord(fields[3][0]) - 97 + 8*(int(fields[3][1]) - 1)
+    self.halfmove_clock = int(fields[4])
+    self.fullmove_number = int(fields[5])
+
+  def getFEN(self):
+    """Get the position in Forsyth-Edwards Notation"""
+    rows = []
+    for y in range(7, -1, -1):
+      row = ''
+      empty = 0
+      for x in range(8):
+        piece = self.board[x + 8*y]
+        if piece == '.':
+          empty += 1
+          continue
+        if empty > 0:
+          row += str(empty)
+          empty = 0
+        row += piece
+      rows.append(row + (str(empty) if empty > 0 else ''))
+    castling = ''.join(right for right in 'KQkq' if right in self.castling) or '-'
+    en_passant = '-'
+    if self.en_passant is not None:
+      en_passant = chr(self.en_passant % 8 + 97) + str(self.en_passant // 8 + 1)
+    return ' '.join(['/'.join(rows), 'w' if self.white else 'b', castling, en_passant,
+        str(self.halfmove_clock), str(self.fullmove_number)])
+
+  def isOwn(self, piece, white):
+    return piece != '.' and piece.isupper() == white
+
+  def isAttacked(self, square, by_white):
+    """Check if the square is attacked by the given side"""
+    x, y = square % 8, square // 8
+    def pieceAt(px, py):
+      if 0 <= px < 8 and 0 <= py < 8:
+        return self.board[px + 8*py]
+      return None
+    pawn, knight, bishop, rook, queen, king = 'PNBRQK' if by_white else 'pnbrqk'
+    pawn_row = y - 1 if by_white else y + 1
+    if pieceAt(x - 1, pawn_row) == pawn or pieceAt(x + 1, pawn_row) == pawn:
+      return True
+    for dx, dy in KNIGHT_STEPS:
+      if pieceAt(x + dx, y + dy) == knight:
+        return True
+    for dx, dy in KING_STEPS:
+      if pieceAt(x + dx, y + dy) == king:
+        return True
+    for directions, sliders in ((ROOK_DIRECTIONS, (rook, queen)), (BISHOP_DIRECTIONS, (bishop, queen))):
+      for dx, dy in directions:
+        px, py = x + dx, y + dy
+        while pieceAt(px, py) == '.':
+          px, py = px + dx, py + dy
+        if pieceAt(px, py) in sliders:
+          return True
+    return False
+
+  def isCheck(self):
+    """Check if the side to move stands in check"""
+    king = 'K' if self.white else 'k'
+    if king not in self.board:
+      return False
+    return self.isAttacked(self.board.index(king), not self.white)
+
+  def getPseudoMoves(self):
+    """Get all moves of the side to move, ignoring whether the own king is left in check"""
+    moves = []
+    white = self.white
+    for square, piece in enumerate(self.board):
+      if not self.isOwn(piece, white):
+        continue
+      x, y = square % 8, square // 8
+      kind = piece.upper()
+      if kind == 'P':
+        direction = 1 if white else -1
+        start_row, last_row = (1, 7) if white else (6, 0)
+        targets = []
+        ahead = square + 8*direction
+        if self.board[ahead] == '.':
+          targets.append(ahead)
+          if y == start_row and self.board[ahead + 8*direction] == '.':
+            targets.append(ahead + 8*direction)
+        for dx in (-1, 1):
+          if 0 <= x + dx < 8:
+            target = ahead + dx
+            if self.isOwn(self.board[target], not white) or target == self.en_passant:
+              targets.append(target)
+        for target in targets:
+          if target // 8 == last_row:
+            moves.extend((square, target, promotion) for promotion in 'qrbn')
+          else:
+            moves.append((square, target, ''))
+      elif kind in 'NK':
+        for dx, dy in (KNIGHT_STEPS if kind == 'N' else KING_STEPS):
+          if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+            target = x + dx + 8*(y + dy)
+            if not self.isOwn(self.board[target], white):
+              moves.append((square, target, ''))
+      else:
+        directions = {'B': BISHOP_DIRECTIONS, 'R': ROOK_DIRECTIONS, 'Q': KING_STEPS}[kind]
+        for dx, dy in directions:
+          px, py = x + dx, y + dy
+          while 0 <= px < 8 and 0 <= py < 8:
+            target = px + 8*py
+            if self.isOwn(self.board[target], white):
+              break
+            moves.append((square, target, ''))
+            if self.board[target] != '.':
+              break
+            px, py = px + dx, py + dy
+    # Castling: king and rook unmoved, squares between empty, king not passing attacked squares
+    row = 0 if white else 7
+    king, rook = ('K', 'R') if white else ('k', 'r')
+    for right, rook_x, empty_xs, passed_xs in (('K', 7, (5, 6), (4, 5, 6)), ('Q', 0, (1, 2, 3), (4, 3, 2))):
+      if (right if white else right.lower()) not in self.castling:
+        continue
+      if self.board[4 + 8*row] != king or self.board[rook_x + 8*row] != rook:
+        continue
+      if any(self.board[ex + 8*row] != '.' for ex in empty_xs):
+        continue
+      if any(self.isAttacked(px + 8*row, not white) for px in passed_xs):
+        continue
+      moves.append((4 + 8*row, passed_xs[2] + 8*row, ''))
+    return moves
+
+  def play(self, move):
+    """Get the position after the move"""
+    start, destination, promotion = move
+    child = ReferencePosition.__new__(ReferencePosition)
+    board = list(self.board)
+    piece = board[start]
+    captured = board[destination]
+    board[destination] = piece
+    board[start] = '.'
+    if piece in 'Pp' and destination == self.en_passant:
+      captured = board[destination - 8 if self.white else destination + 8]
+      board[destination - 8 if self.white else destination + 8] = '.'
+    if promotion:
+      board[destination] = promotion.upper() if self.white else promotion
+    if piece in 'Kk' and abs(destination - start) == 2:
+      rook_start, rook_destination = (start + 3, start + 1) if destination > start else (start - 4, start - 1)
+      board[rook_destination] = board[rook_start]
+      board[rook_start] = '.'
+    child.board = board
+    child.white = not self.white
+    child.castling = set(self.castling)
+    for square, rights in ((4, 'KQ'), (60, 'kq'), (0, 'Q'), (7, 'K'), (56, 'q'), (63, 'k')):
+      if start == square or destination == square:
+        child.castling -= set(rights)
+    child.en_passant = None
+    if piece in 'Pp' and abs(destination - start) == 16:
+      child.en_passant = (start + destination) // 2
+    child.halfmove_clock = 0 if piece in 'Pp' or captured != '.' else self.halfmove_clock + 1
+    child.fullmove_number = self.fullmove_number + (0 if self.white else 1)
+    return child
+
+  def getLegalMoves(self):
+    """Get all moves not leaving the own king in check"""
+    moves = []
+    for move in self.getPseudoMoves():
+      child = self.play(move)
+      child.white = self.white
+      if not child.isCheck():
+        moves.append(move)
+    return moves
+
+  def getResult(self, legal_moves, in_check):
+    """
+    Get the expected return value of ChessGame.move() for the move that led here
+    Input:
+      legal_moves: List of Tuple    - as returned by getLegalMoves()
+      in_check: Bool                - as returned by isCheck()
+    Return:
+      Int (see ChessGame.move())
+    """
+    has_moves = len(legal_moves) > 0
+    if in_check and not has_moves:
+      # The side to move lost, the other one won
+      return 4 if self.white else 3
+    if in_check:
+      return 2 if self.white else 1
+    if not has_moves or self.halfmove_clock >= 150:
+      return 5
+    return 0
+
+def referenceMoveToString(move):
+  """Get the coordinate notation of a reference move"""
+  start, destination, promotion = move
+  return (chr(start % 8 + 97) + str(start // 8 + 1) + chr(destination % 8 + 97)
+      + str(destination // 8 + 1) + promotion)
+
+def findDiscrepancy(fen, moves, rng=None, max_plies=0):
+  """
+  Replay the moves from the position on the backend and the reference and
+  compare them at every ply. The valid moves of the reference are generated
+  once per ply and used for the comparison, the result of the previous move
+  and picking the next random move
+  Input:
+    fen: String
+    moves: List of String           - Moves in coordinate notation, valid for the reference.
+                                      With rng, random moves are appended to it
+    rng: random.Random              - Continue with random moves after the given ones
+    max_plies: Int                  - Length of the game when continuing with random moves
+  Return:
+    String describing the first difference, None if there is none. The game is cut
+    right after it, so moves ends with the failing move
+  """
+  game = ChessGame(fen)
+  reference = ReferencePosition(fen)
+  retval = None
+  ply = 0
+  while True:
+    legal_moves = reference.getLegalMoves()
+    in_check = reference.isCheck()
+    if retval is not None:
+      expected = reference.getResult(legal_moves, in_check)
+      if retval != expected:
+        return 'ply %d: %s returned %d, reference %d' % (ply - 1, moves[ply - 1], retval, expected)
+    reference_moves = {referenceMoveToString(move): move for move in legal_moves}
+    backend_moves = set(moveToCoordinates(*move) for move in game.getLegalMoves())
+    if backend_moves != set(reference_moves):
+      return 'ply %d: valid moves differ, backend only %s, reference only %s' % (ply,
+          sorted(backend_moves - set(reference_moves)), sorted(set(reference_moves) - backend_moves))
+    if game.board.isCheck(game.current_player)[0] != in_check:
+      return 'ply %d: check status differs, reference %s' % (ply, in_check)
+    if ply == len(moves):
+      if rng is None or ply >= max_plies or len(legal_moves) == 0 or reference.halfmove_clock >= 150:
+        return None
+      moves.append(referenceMoveToString(rng.choice(legal_moves)))
+    move_str = moves[ply]
+    reference = reference.play(reference_moves[move_str])
+    start, destination, promotion_str = coordinatesToMove(move_str)
+    retval = game.moveCoordinates(start, destination, promotion_str, move_str)
+    ply += 1
+
+def isSane(reference):
+  """Check that a shrunk position is still a proper chess position"""
+  if reference.board.count('K') != 1 or reference.board.count('k') != 1:
+    return False
+  if any(piece in 'Pp' for piece in reference.board[:8] + reference.board[56:]):
+    return False
+  # The side not to move must not stand in check
+  reference.white = not reference.white
+  in_check = reference.isCheck()
+  reference.white = not reference.white
+  return not in_check
+
+def replayReference(fen, moves):
+  """
+  Play the moves on the reference
+  Return:
+    List of String                  - FEN before every move and after the last, None if a move is invalid
+  """
+  reference = ReferencePosition(fen)
+  fens = [fen]
+  for move_str in moves:
+    legal = {referenceMoveToString(move): move for move in reference.getLegalMoves()}
+    if move_str not in legal:
+      return None
+    reference = reference.play(legal[move_str])
+    fens.append(reference.getFEN())
+  return fens
+
+def isFailing(fen, moves):
+  """Check if replaying the moves shows a difference, counting exceptions of the backend"""
+  try:
+    return findDiscrepancy(fen, moves) is not None
+  except Exception:
+    return True
+
+def shrink(fen, moves):
+  """
+  Shrink a failing game: start as late as possible, then remove figures
+  from the start position as long as the failure persists
+  Input:
+    fen: String
+    moves: List of String
+  Return:
+    Tuple of String and List of String - minimal FEN and moves
+  """
+  fens = replayReference(fen, moves)
+  for start in range(len(moves), -1, -1):
+    if isFailing(fens[start], moves[start:]):
+      fen, moves = fens[start], moves[start:]
+      break
+  shrunk = True
+  while shrunk:
+    shrunk = False
+    reference = ReferencePosition(fen)
+    for square, piece in enumerate(reference.board):
+      if piece in '.Kk':
+        continue
+      reference.board[square] = '.'
+      candidate = reference.getFEN()
+      reference.board[square] = piece
+      if not isSane(ReferencePosition(candidate)) or replayReference(candidate, moves) is None:
+        continue
+      if isFailing(candidate, moves):
+        fen = candidate
+        shrunk = True
+        break
+  return fen, moves
+
+def fuzzGame(seed, max_plies=200):
+  """
+  Play a random game on the backend and compare it against the reference
+  Input:
+    seed: Int
+    max_plies: Int
+  Return:
+    Tuple of Int and Tuple          - number of plies, and (FEN, moves, description) of a
+                                      shrunk failure or None
+  """
+  fen = ChessGame().getFEN()
+  moves = []
+  try:
+    discrepancy = findDiscrepancy(fen, moves, random.Random(seed), max_plies)
+  except Exception as exception:
+    discrepancy = 'backend raised %r' % exception
+  if discrepancy is None:
+    return len(moves), None
+  shrunk_fen, shrunk_moves = shrink(fen, moves)
+  try:
+    discrepancy = findDiscrepancy(shrunk_fen, shrunk_moves) or discrepancy
+  except Exception as exception:
+    discrepancy = 'backend raised %r' % exception
+  return len(moves), (shrunk_fen, shrunk_moves, discrepancy)
+
+def fuzz(games, processes=None, seed=0):
+  """
+  Fuzz the backend with many random games across processes
+  Input:
+    games: Int
+    processes: Int                  - Number of processes, the number of cores if None
+    seed: Int                       - Seed of the first game, game i uses seed + i
+  Return:
+    List of Tuple                   - distinct shrunk failures (FEN, moves, description)
+  """
+  start_time = time.perf_counter()
+  failures = {}
+  plies = 0
+  with multiprocessing.Pool(processes) as pool:
+    for game_plies, failure in pool.imap_unordered(fuzzGame, range(seed, seed + games)):
+      plies += game_plies
+      if failure is not None and (failure[0], tuple(failure[1])) not in failures:
+        failures[(failure[0], tuple(failure[1]))] = failure
+        print('FEN: %s moves: %s\n  %s' % (failure[0], ' '.join(failure[1]), failure[2]))
+  elapsed = time.perf_counter() - start_time
+  print('%d games, %d plies in %.1fs (%.0f plies/s), %d distinct failures'
+      % (games, plies, elapsed, plies / elapsed, len(failures)))
+  return list(failures.values())
+
+if __name__ == '__main__':
+  arguments = [int(argument) for argument in sys.argv[1:]]
+  games = arguments[0] if len(arguments) > 0 else 100
+  processes = arguments[1] if len(arguments) > 1 else None
+  seed = arguments[2] if len(arguments) > 2 else 0
+  sys.exit(1 if fuzz(games, processes, seed) else 0)
@@ -0,0 +1,92 @@
+"""
+Replay and annotate recorded games, e.g. after a tournament
+"""
+
+import multiprocessing
+
+from game.ChessGame import ChessGame
+from game.SearchAI import SearchAI
+
+def analyseGame(fide_history, engine=None, time_budget=None, fen=None):
+  """
+  Replay a recorded game and annotate every ply. The annotations are
+  generated one at a time, while the game is replayed
+  Input:
+    fide_history: List of String    - Moves according to FIDE chess standard
+    engine: Object of class SearchAI - Evaluates every position, no evaluation if None
+    time_budget: Float              - Seconds the engine may spend per position
+    fen: String                     - Position the game started from, the initial position if None
+  Return:
+    Generator of Dict with the keys
+      ply: Int
+      move: String
+      valid: Bool                   - False if the move could not be replayed, which ends the game
+      result: Int                   - Return value of ChessGame.move()
+      fen: String                   - Position after the move
+      material: Int                 - Sum of figure values of white minus black
+      check: Bool                   - Player to move stands in check
+      legal_moves: Int              - Number of valid moves of the player to move
+      evaluation: Int               - Engine score from the view of white, None without engine
+      best_move: Tuple              - Best move found by the engine, None without engine
+  """
+  game = ChessGame(fen)
+  for ply, fide_str in enumerate(fide_history):
+    retval = game.move(fide_str)
+    annotation = {
+      'ply': ply + 1,
+      'move': fide_str,
+      'valid': retval != -1,
+      'result': retval,
+      'fen': game.getFEN(),
+    }
+    if retval == -1:
+      yield annotation
+      return
+    scores = game.getScores()
+    legal_moves = game.getLegalMoves()
+    annotation['material'] = scores[0] - scores[1]
+    annotation['check'] = game.board.isCheck(game.current_player)[0]
+    annotation['legal_moves'] = len(legal_moves)
+    annotation['evaluation'] = None
+    annotation['best_move'] = None
+    if engine is not None and len(legal_moves) > 0:
+      annotation['best_move'] = engine.getMove(game, time_budget)
+      if 'score' in engine.stats:
+        score = engine.stats['score']
+        annotation['evaluation'] = score if game.current_player == 0 else -score
+    yield annotation
+
+def analyseGameWorker(task):
+  """
+  Annotate a whole game in a worker process
+  Input:
+    task: Tuple of List of String, Int and Float - moves of the game, engine depth
+                                                   (no engine if None) and time budget
+  Return:
+    List of Dict (see analyseGame())
+  """
+  fide_history, engine_depth, time_budget = task
+  engine = None
+  if engine_depth is not None:
+    engine = SearchAI(depth=engine_depth, table_size=2**12)
+  try:
+    return list(analyseGame(fide_history, engine, time_budget))
+  finally:
+    if engine is not None:
+      engine.close()
+
+def analyseTournament(games, processes=None, engine_depth=None, time_budget=None):
+  """
+  Annotate many games at once, spread over a pool of processes
+  Input:
+    games: List of List of String   - Moves of every game
+    processes: Int                  - Number of processes, the number of cores if None
+    engine_depth: Int               - Depth of the engine evaluation, no evaluation if None
+    time_budget: Float              - Seconds the engine may spend per position
+  Return:
+    Generator of List of Dict       - Annotations of each game (see analyseGame()), in order
+  """
+  with multiprocessing.Pool(processes) as pool:
+    tasks = [(fide_history, engine_depth, time_budget) for fide_history in games]
+    for annotations in pool.imap(analyseGameWorker, tasks):
+      yield annotations
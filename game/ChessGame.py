@@ -7,6 +7,116 @@ class NoFigureException(Exception):
     super().__init__(message)
 
 import copy
+from collections import OrderedDict
+
+def generateZobristKeys(seed=20200815):
+  """
+  Generate the random keys used for hashing positions with SplitMix64. The keys
+  only depend on the seed, so every process generates the same keys
+  Input:
+    seed: Int
+  Return:
+    Dict with the keys 'figures' (List of List of Int, indexed by figure ID and square),
+    'castling' (Dict of String to Int), 'en_passant' (List of Int, indexed by column)
+    and 'player' (Int)
+  """
+  mask = 2**64 - 1
+  keys = []
+  state = seed
+  for _ in range(14*64 + 4 + 8 + 1):
+    state = (state + 0x9e3779b97f4a7c15) & mask
+    value = ((state ^ (state >> 30)) * 0xbf58476d1ce4e5b9) & mask
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & mask
+    keys.append(value ^ (value >> 31))
+  return {
+    'figures': [keys[64*i:64*(i+1)] for i in range(14)],
+    'castling': dict(zip('KQkq', keys[896:900])),
+    'en_passant': keys[900:908],
+    'player': keys[908],
+  }
+
+ZOBRIST_KEYS = None
+
+def getZobristKeys():
+  """
+  Get the keys used for hashing positions, generated on first use
+  Input:
+  Return:
+    Dict (see generateZobristKeys())
+  """
+  global ZOBRIST_KEYS
+  if ZOBRIST_KEYS is None:
+    ZOBRIST_KEYS = generateZobristKeys()
+  return ZOBRIST_KEYS
+
+class PositionCache:
+  """
+  Bounded LRU cache for the results of queries about positions. The keys
+  contain the Zobrist hash of the position, so results are shared by all
+  games of the process and a changed position never hits a stale result
+  """
+  def __init__(self, max_entries=100000):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key):
+    """
+    Look up a cached result
+    Input:
+      key: Tuple                    - Hash of the position, name of the query and its arguments
+    Return:
+      Cached result, None if not cached
+    """
+    value = self.entries.get(key)
+    if value is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self.entries.move_to_end(key)
+    return value
+
+  def put(self, key, value):
+    """
+    Cache a result, evicting the least recently used ones beyond max_entries
+    Input:
+      key: Tuple
+      value: Anything but None
+    Return:
+    """
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+    while len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def clear(self):
+    """Remove all entries and reset the statistics"""
+    self.entries.clear()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def getStats(self):
+    """
+    Get the statistics of the cache
+    Input:
+    Return:
+      Dict of String to Number      - entries, hits, misses, evictions and hit_rate
+    """
+    lookups = self.hits + self.misses
+    return {
+      'entries': len(self.entries),
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / lookups if lookups > 0 else 0,
+    }
+
+# Shared by all boards of the process, set QUERY_CACHE.max_entries to change the budget
+QUERY_CACHE = PositionCache()
 
 def isOnBoard(position):
   """
@@ -26,6 +136,146 @@ def isOnBoard(position):
     return False
   return True
 
+# Squares are numbered from 0 (a1) to 63 (h8) as x + 8*y. Positions are always
+# tuples, the ones in this table are shared instead of allocating new ones
+SQUARE_POSITIONS = tuple((index % 8, index // 8) for index in range(64))
+
+def squareIndex(position):
+  """
+  Get the index of a square
+  Input:
+    position: Tuple of Int
+  Return:
+    Int                             - 0 (a1) to 63 (h8)
+  """
+  return position[0] + 8*position[1]
+
+def squarePosition(index):
+  """
+  Get the position of a square
+  Input:
+    index: Int                      - 0 (a1) to 63 (h8)
+  Return:
+    Tuple of Int
+  """
+  return SQUARE_POSITIONS[index]
+
+# Moves are packed into 16 bits: start square (bits 0-5), destination square
+# (bits 6-11), promotion figure (bits 12-13) and kind of move (bits 14-15)
+NORMAL = 0
+PROMOTION = 1
+EN_PASSANT = 2
+CASTLING = 3
+PROMOTION_STRS = ('N', 'B', 'R', 'Q')
+
+def encodeMove(start, destination, promotion_str='', flags=NORMAL):
+  """
+  Pack a move into an Int
+  Input:
+    start: Tuple of Int
+    destination: Tuple of Int
+    promotion_str: String           - 'Q', 'R', 'B', 'N' or ''
+    flags: Int                      - NORMAL, PROMOTION, EN_PASSANT or CASTLING
+  Return:
+    Int
+  Raises ValueError for an unknown promotion string, or a promotion without one
+  """
+  move = start[0] + 8*start[1] | (destination[0] + 8*destination[1]) << 6
+  if promotion_str != '':
+    return move | PROMOTION_STRS.index(promotion_str) << 12 | PROMOTION << 14
+  if flags == PROMOTION:
+    raise ValueError('Promotion without a figure')
+  return move | flags << 14
+
+def decodeMove(move):
+  """
+  Unpack a move
+  Input:
+    move: Int
+  Return:
+    Tuple of (Tuple of Int, Tuple of Int, String) - start, destination and promotion
+  """
+  if move >> 14 == PROMOTION:
+    promotion_str = PROMOTION_STRS[(move >> 12) & 3]
+  else:
+    promotion_str = ''
+  return SQUARE_POSITIONS[move & 63], SQUARE_POSITIONS[(move >> 6) & 63], promotion_str
+
+def getMoveStart(move):
+  """Get the start position of a packed move"""
+  return SQUARE_POSITIONS[move & 63]
+
+def getMoveDestination(move):
+  """Get the destination position of a packed move"""
+  return SQUARE_POSITIONS[(move >> 6) & 63]
+
+def getMoveFlags(move):
+  """Get the kind of a packed move: NORMAL, PROMOTION, EN_PASSANT or CASTLING"""
+  return move >> 14
+
+def coordinatesToMove(move_str):
+  """
+  Translate a move in coordinate notation, as used by UCI
+  Input:
+    move_str: String                - e.g. 'e2e4', 'e7e8q'
+  Return:
+    Tuple of (Tuple of Int, Tuple of Int, String) - start, destination and promotion
+  """
+  return ((ord(move_str[0]) - 97, int(move_str[1]) - 1),
+      (ord(move_str[2]) - 97, int(move_str[3]) - 1), move_str[4:].upper())
+
+def moveToCoordinates(start, destination, promotion_str=''):
+  """
+  Get the coordinate notation of a move, use moveToCoordinates(*decodeMove(move))
+  for packed moves
+  Input:
+    start: Tuple of Int
+    destination: Tuple of Int
+    promotion_str: String
+  Return:
+    String                          - e.g. 'e2e4', 'e7e8q'
+  """
+  return (chr(start[0] + 97) + str(start[1] + 1) + chr(destination[0] + 97)
+      + str(destination[1] + 1) + promotion_str.lower())
+
+KNIGHT_OFFSETS = [(1,2), (2, 1), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1)]
+KING_OFFSETS = [(0, -1), (0, 1), (1, 0), (-1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+def generateTargets(offsets):
+  """
+  Generate the squares reachable with a single step from every square
+  Input:
+    offsets: List of Tuple of Int
+  Return:
+    List of List of Tuple of Int    - indexed by x + 8*y of the start square
+  """
+  return [[(x + dx, y + dy) for dx, dy in offsets if isOnBoard((x + dx, y + dy))]
+      for y in range(8) for x in range(8)]
+
+def generateRays(directions):
+  """
+  Generate the squares along every direction from every square, nearest first
+  Input:
+    directions: List of Tuple of Int
+  Return:
+    List of Dict of Tuple of Int to List of Tuple of Int - indexed by x + 8*y of the start square
+  """
+  rays = []
+  for y in range(8):
+    for x in range(8):
+      square_rays = {}
+      for dx, dy in directions:
+        steps = min(7 - x if dx > 0 else x if dx < 0 else 7,
+            7 - y if dy > 0 else y if dy < 0 else 7)
+        square_rays[(dx, dy)] = [(x + i*dx, y + i*dy) for i in range(1, steps + 1)]
+      rays.append(square_rays)
+  return rays
+
+# Lookup tables for the figure movements
+KNIGHT_TARGETS = generateTargets(KNIGHT_OFFSETS)
+KING_TARGETS = generateTargets(KING_OFFSETS)
+RAYS = generateRays(KING_OFFSETS)
+
 class Figure:
   """Superclass for a figure on the board"""
   def __init__(self, board, position, player, value):
@@ -72,7 +322,7 @@ class Figure:
       Bool
     """
     for possible_move in self.possible_moves:
-      destination = [self.position[0] + possible_move[0], self.position[1] + possible_move[1]]
+      destination = (self.position[0] + possible_move[0], self.position[1] + possible_move[1])
       if self.isValidMove(destination):
         return True
     return False
@@ -121,13 +371,17 @@ class Pawn(Figure):
           or self.player == 1 and destination[1] != self.position[1]-1):
         return False
     elif abs(destination[0] - self.position[0]) == 0:
+      # Moving straight cannot take
+      if not isinstance(dest_figure, Empty):
+        return False
       if abs(self.position[1] - destination[1]) == 2:
         if self.has_moved:
           return False
-        elif(self.board.isPathClear(self.position, destination)
-            and (self.player == 1 and destination[1] == self.position[1]+2
-                or self.player == 2 and destination[1] == self.position[1]-2)):
-          return True
+        if not self.board.isPathClear(self.position, destination):
+          return False
+        if(self.player == 0 and destination[1] != self.position[1]+2
+            or self.player == 1 and destination[1] != self.position[1]-2):
+          return False
       elif(self.player == 0 and destination[1] != self.position[1]+1
           or self.player == 1 and destination[1] != self.position[1]-1):
         return False
@@ -141,7 +395,6 @@ class Pawn(Figure):
     """
     Check if the desired en passant taking is possible
     Input:
-      last_move: Tuple of (Tuple of Tuple of int) and Object of class Figure
       destination: Tuple of int
     Return:
       Bool
@@ -151,8 +404,8 @@ class Pawn(Figure):
     except IndexError:
       # First move, cannot be en passant
       return False
-    last_destination = last_move[0][1]
-    last_start = last_move[0][0]
+    last_destination = getMoveDestination(last_move[0])
+    last_start = getMoveStart(last_move[0])
     figure = self.board.getFigure(last_destination)
     if not isinstance(figure, Pawn):
       return False
@@ -169,7 +422,7 @@ class Knight(Figure):
   def __init__(self, board, position, player):
     super().__init__(board, position, player, 3)
     self.name = 'n'
-    self.possible_moves = [(1,2), (2, 1), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1)]
+    self.possible_moves = KNIGHT_OFFSETS
 
   def getID(self):
     return 2 + 7*self.player
@@ -180,12 +433,12 @@ class Knight(Figure):
     dest_figure = self.board.getFigure(destination)
     if dest_figure.player == self.player:
       return False
-    if(abs(destination[1] - self.position[1]) == 2 and abs(destination[0] - self.position[0]) == 1
+    if not(abs(destination[1] - self.position[1]) == 2 and abs(destination[0] - self.position[0]) == 1
         or abs(destination[1] - self.position[1]) == 1 and abs(destination[0] - self.position[0]) == 2):
-      return True
+      return False
     if self.board.meansCheck(self, destination):
       return False
-    return False
+    return True
 
 class Bishop(Figure):
   """Class for the bishop figure"""
@@ -282,14 +535,14 @@ class King(Figure):
       if destination[0] > self.position[0]:
         rook = self.board.getFigure((7, self.position[1]))
         intermediate_field = (self.position[0]+1, self.position[1])
-        next_to_rook = rook.position[0]-1, self.position[1]
       else:
         rook = self.board.getFigure((0, self.position[1]))
         intermediate_field = (self.position[0]-1, self.position[1])
-        next_to_rook = rook.position[0]+1, self.position[1]
-      if rook.has_moved:
+      if not isinstance(rook, Rook) or rook.player != self.player or rook.has_moved:
         return False
-      if not self.board.isPathClear(self.position, next_to_rook):
+      if self.board.isCheck(self.player)[0]:
+        return False
+      if not self.board.isPathClear(self.position, rook.position):
         return False
       if self.board.meansCheck(self, intermediate_field):
         return False
@@ -320,34 +573,379 @@ class Board:
   """Class for the chess board"""
   game = None
 
-  def __init__(self):
-    self.board = [[Empty(self, (x, y)) for x in range(8)] for y in range(8)]
+  def __init__(self, setup=True):
+    """
+    Create a board
+    Input:
+      setup: Bool                   - Set up the initial position, else the board stays empty
+    """
+    # Half-moves since the last capture or pawn move, and number of the current full move
+    self.halfmove_clock = 0
+    self.fullmove_number = 1
+    if not setup:
+      self.clear()
+      return
+    self.createEmptySquares()
     for i in range(8):
-      self.board[i][1] = Pawn(self, [i, 1], 0)
-      self.board[i][6] = Pawn(self, [i, 6], 1)
-    self.board[0][0] = Rook(self, [0, 0], 0)
-    self.board[7][0] = Rook(self, [7, 0], 0)
-    self.board[0][7] = Rook(self, [0, 7], 1)
-    self.board[7][7] = Rook(self, [7, 7], 1)
-    self.board[1][0] = Knight(self, [1, 0], 0)
-    self.board[6][0] = Knight(self, [6, 0], 0)
-    self.board[1][7] = Knight(self, [1, 7], 1)
-    self.board[6][7] = Knight(self, [6, 7], 1)
-    self.board[2][0] = Bishop(self, [2, 0], 0)
-    self.board[5][0] = Bishop(self, [5, 0], 0)
-    self.board[2][7] = Bishop(self, [2, 7], 1)
-    self.board[5][7] = Bishop(self, [5, 7], 1)
-    self.board[3][0] = Queen(self, [3, 0], 0)
-    self.board[3][7] = Queen(self, [3, 7], 1)
-    self.kings = [King(self, [4, 0], 0), King(self, [4, 7], 1)]
-    self.board[4][0] = self.kings[0]
-    self.board[4][7] = self.kings[1]
+      self.board[i + 8] = Pawn(self, (i, 1), 0)
+      self.board[i + 48] = Pawn(self, (i, 6), 1)
+    self.board[0] = Rook(self, (0, 0), 0)
+    self.board[7] = Rook(self, (7, 0), 0)
+    self.board[56] = Rook(self, (0, 7), 1)
+    self.board[63] = Rook(self, (7, 7), 1)
+    self.board[1] = Knight(self, (1, 0), 0)
+    self.board[6] = Knight(self, (6, 0), 0)
+    self.board[57] = Knight(self, (1, 7), 1)
+    self.board[62] = Knight(self, (6, 7), 1)
+    self.board[2] = Bishop(self, (2, 0), 0)
+    self.board[5] = Bishop(self, (5, 0), 0)
+    self.board[58] = Bishop(self, (2, 7), 1)
+    self.board[61] = Bishop(self, (5, 7), 1)
+    self.board[3] = Queen(self, (3, 0), 0)
+    self.board[59] = Queen(self, (3, 7), 1)
+    self.kings = [King(self, (4, 0), 0), King(self, (4, 7), 1)]
+    self.board[4] = self.kings[0]
+    self.board[60] = self.kings[1]
     self.player_figures = [[], []]
     for i in range(8):
-      self.player_figures[0].append(self.board[i][0])
-      self.player_figures[0].append(self.board[i][1])
-      self.player_figures[1].append(self.board[i][6])
-      self.player_figures[1].append(self.board[i][7])
+      self.player_figures[0].append(self.board[i])
+      self.player_figures[0].append(self.board[i + 8])
+      self.player_figures[1].append(self.board[i + 48])
+      self.player_figures[1].append(self.board[i + 56])
+    self.invalidate()
+
+  def invalidate(self):
+    """
+    Drop all cached information about the position, called whenever it changes
+    Input:
+    Return:
+    """
+    self.attack_maps = [None, None]
+    self.pinned_figures = [None, None]
+    self.hash = None
+
+  def createEmptySquares(self):
+    """
+    Create one Empty per square, reused whenever the square is vacated, and
+    fill the board with them. The board is a list of the 64 squares, indexed
+    by squareIndex()
+    Input:
+    Return:
+    """
+    self.empty_squares = [Empty(self, position) for position in SQUARE_POSITIONS]
+    self.board = list(self.empty_squares)
+
+  def clear(self):
+    """
+    Remove all figures from the board
+    Input:
+    Return:
+    """
+    self.createEmptySquares()
+    self.player_figures = [[], []]
+    self.kings = [None, None]
+    self.invalidate()
+
+  def placeFigure(self, figure):
+    """
+    Put a new figure on the board (used to set up positions)
+    Input:
+      figure: Object of class Figure
+    Return:
+    """
+    self.board[figure.position[0] + 8*figure.position[1]] = figure
+    self.player_figures[figure.player].append(figure)
+    if isinstance(figure, King):
+      self.kings[figure.player] = figure
+    self.invalidate()
+
+  def getCastlingRights(self):
+    """
+    Get the castling rights in FEN notation
+    Input:
+    Return:
+      String                        - e.g. 'KQkq', '-' if no player can castle
+    """
+    rights = ''
+    for player, row in ((0, 0), (1, 7)):
+      king = self.kings[player]
+      if king is None or king.has_moved or king.position != (4, row):
+        continue
+      for column, right in ((7, 'K'), (0, 'Q')):
+        rook = self.board[column + 8*row]
+        if isinstance(rook, Rook) and rook.player == player and not rook.has_moved:
+          rights += right if player == 0 else right.lower()
+    return rights or '-'
+
+  def getEnPassantSquare(self):
+    """
+    Get the square a pawn can be taken en passant on
+    Input:
+    Return:
+      Tuple of Int, None if there is no such square
+    """
+    if self.game is None or len(self.game.history) == 0:
+      return None
+    last_move = self.game.history[-1][0]
+    last_start, last_destination = getMoveStart(last_move), getMoveDestination(last_move)
+    if abs(last_destination[1] - last_start[1]) != 2:
+      return None
+    if not isinstance(self.getFigure(last_destination), Pawn):
+      return None
+    return (last_destination[0], (last_start[1] + last_destination[1]) // 2)
+
+  def getHash(self):
+    """
+    Get the Zobrist hash of the figures, castling rights and en passant square.
+    Computed on first use and kept until the next update of the board
+    Input:
+    Return:
+      Int
+    """
+    if self.hash is None:
+      zobrist_keys = getZobristKeys()
+      figure_keys = zobrist_keys['figures']
+      value = 0
+      for player_figures in self.player_figures:
+        for figure in player_figures:
+          value ^= figure_keys[figure.getID()][figure.position[0] + 8*figure.position[1]]
+      for right in self.getCastlingRights():
+        if right != '-':
+          value ^= zobrist_keys['castling'][right]
+      en_passant = self.getEnPassantSquare()
+      if en_passant is not None:
+        value ^= zobrist_keys['en_passant'][en_passant[0]]
+      self.hash = value
+    return self.hash
+
+  def getCandidateDestinations(self, figure):
+    """
+    Get the destinations the figure might move to, without checking the validity
+    Input:
+      figure: Object of class Figure
+    Return:
+      List of Tuple of Int
+    """
+    x, y = figure.position
+    if isinstance(figure, Pawn):
+      return [(x + dx, y + dy) for dx, dy in figure.possible_moves if isOnBoard((x + dx, y + dy))]
+    destinations = self.getAttackedSquares(figure)
+    if isinstance(figure, King) and not figure.has_moved:
+      destinations += [(x + 2, y), (x - 2, y)]
+    return destinations
+
+  def getLegalMoves(self, player):
+    """
+    Get all valid moves of the player
+    Input:
+      player: Int
+    Return:
+      List of Tuple of (Tuple of Int, Tuple of Int, String) - start, destination and promotion
+    """
+    key = (self.getHash(), 'legal_moves', player)
+    moves = QUERY_CACHE.get(key)
+    if moves is not None:
+      return list(moves)
+    moves = []
+    for figure in list(self.player_figures[player]):
+      start = figure.position
+      for destination in self.getCandidateDestinations(figure):
+        if not figure.isValidMove(destination):
+          continue
+        if isinstance(figure, Pawn) and destination[1] in (0, 7):
+          for promotion_str in ('Q', 'R', 'B', 'N'):
+            moves.append((start, destination, promotion_str))
+        else:
+          moves.append((start, destination, ''))
+    QUERY_CACHE.put(key, tuple(moves))
+    return moves
+
+  def getAttackedSquares(self, figure):
+    """
+    Get the squares the figure attacks (including squares occupied by own figures).
+    Sliding figures look through the opposing king, so that squares behind the
+    king are attacked as well
+    Input:
+      figure: Object of class Figure
+    Return:
+      List of Tuple of Int
+    """
+    x, y = figure.position
+    if isinstance(figure, Pawn):
+      direction = 1 if figure.player == 0 else -1
+      return [(x + dx, y + direction) for dx in (-1, 1) if isOnBoard((x + dx, y + direction))]
+    if isinstance(figure, Knight):
+      return list(KNIGHT_TARGETS[x + 8*y])
+    if isinstance(figure, King):
+      return list(KING_TARGETS[x + 8*y])
+    squares = []
+    rays = RAYS[x + 8*y]
+    for direction in figure.possible_moves:
+      for square in rays[direction]:
+        squares.append(square)
+        target = self.board[square[0] + 8*square[1]]
+        if not isinstance(target, Empty) and not (isinstance(target, King) and target.player != figure.player):
+          break
+    return squares
+
+  def getAttackMap(self, player):
+    """
+    Get the squares attacked by the player. The map is computed on first use
+    and kept until the next update of the board
+    Input:
+      player: Int
+    Return:
+      Dict of Tuple of Int to List of Objects of class Figure - the attackers of each square
+    """
+    if self.attack_maps[player] is None:
+      attack_map = {}
+      for figure in self.player_figures[player]:
+        for square in self.getAttackedSquares(figure):
+          if square in attack_map:
+            attack_map[square].append(figure)
+          else:
+            attack_map[square] = [figure]
+      self.attack_maps[player] = attack_map
+    return self.attack_maps[player]
+
+  def getAttackers(self, square, removed=()):
+    """
+    Get the figures of both players attacking the square
+    Input:
+      square: Tuple of Int
+      removed: Set of Tuple of Int  - Squares to treat as empty
+    Return:
+      List of Objects of class Figure
+    """
+    attackers = []
+    index = square[0] + 8*square[1]
+    for position in KNIGHT_TARGETS[index]:
+      figure = self.board[position[0] + 8*position[1]]
+      if isinstance(figure, Knight) and position not in removed:
+        attackers.append(figure)
+    for position in KING_TARGETS[index]:
+      figure = self.board[position[0] + 8*position[1]]
+      if position in removed:
+        continue
+      if isinstance(figure, King):
+        attackers.append(figure)
+      elif isinstance(figure, Pawn) and position[0] != square[0]:
+        # A pawn attacks diagonally forward
+        if square[1] - position[1] == (1 if figure.player == 0 else -1):
+          attackers.append(figure)
+    for direction in KING_OFFSETS:
+      attacker = self.getSliderBehind(square, direction, removed)
+      if attacker is not None:
+        attackers.append(attacker)
+    return attackers
+
+  def getSliderBehind(self, square, direction, removed):
+    """
+    Get the first figure seen from the square in the direction, if it is a
+    sliding figure attacking along that direction
+    Input:
+      square: Tuple of Int
+      direction: Tuple of Int
+      removed: Set of Tuple of Int  - Squares to treat as empty
+    Return:
+      Object of class Figure, None if there is no such figure
+    """
+    if direction[0] == 0 or direction[1] == 0:
+      slider_types = (Rook, Queen)
+    else:
+      slider_types = (Bishop, Queen)
+    for position in RAYS[square[0] + 8*square[1]][direction]:
+      figure = self.board[position[0] + 8*position[1]]
+      if isinstance(figure, Empty) or position in removed:
+        continue
+      if isinstance(figure, slider_types):
+        return figure
+      return None
+    return None
+
+  def staticExchange(self, move):
+    """
+    Static exchange evaluation: the material won by the moving player if both
+    players keep taking on the destination with their least valuable figure,
+    each stopping when taking on would lose material. Sliding figures behind
+    the takers join in (x-rays). No moves are made on the board, pins are ignored
+    Input:
+      move: Tuple of Tuple of Int   - start and destination (further entries are ignored)
+    Return:
+      Int                           - Won material in figure values, negative if lost
+    """
+    start, destination = move[0], move[1]
+    figure = self.getFigure(start)
+    victim = self.getFigure(destination)
+    removed = {start}
+    if isinstance(victim, Empty) and isinstance(figure, Pawn) and start[0] != destination[0]:
+      # En passant, the victim is next to the destination
+      victim = self.getFigure((destination[0], start[1]))
+      removed.add(victim.position)
+    attackers = self.getAttackers(destination, removed)
+    gains = [victim.value]
+    value_on_square = figure.value
+    last_position = start
+    player = 1 - figure.player
+    while True:
+      if not isinstance(figure, Knight):
+        # Uncover sliding figures behind the last taker
+        direction = ((last_position[0] > destination[0]) - (last_position[0] < destination[0]),
+            (last_position[1] > destination[1]) - (last_position[1] < destination[1]))
+        attacker = self.getSliderBehind(destination, direction, removed)
+        if attacker is not None and attacker not in attackers:
+          attackers.append(attacker)
+      own_attackers = [attacker for attacker in attackers if attacker.player == player]
+      if len(own_attackers) == 0:
+        break
+      figure = min(own_attackers, key=lambda attacker: attacker.value)
+      if isinstance(figure, King) and any(attacker.player != player for attacker in attackers):
+        # The king cannot take a defended figure
+        break
+      gains.append(value_on_square - gains[-1])
+      value_on_square = figure.value
+      last_position = figure.position
+      removed.add(last_position)
+      attackers.remove(figure)
+      player = 1 - player
+    # Each player may stop taking when it would lose material
+    for i in range(len(gains) - 1, 0, -1):
+      gains[i-1] = -max(-gains[i-1], gains[i])
+    return gains[0]
+
+  def getPinnedFigures(self, player):
+    """
+    Get the figures of the player which are pinned to their king. Computed on
+    first use and kept until the next update of the board
+    Input:
+      player: Int
+    Return:
+      Set of Objects of class Figure
+    """
+    if self.pinned_figures[player] is None:
+      pinned = set()
+      king = self.kings[player]
+      rays = RAYS[king.position[0] + 8*king.position[1]]
+      for direction in KING_OFFSETS:
+        if direction[0] == 0 or direction[1] == 0:
+          pinning_types = (Rook, Queen)
+        else:
+          pinning_types = (Bishop, Queen)
+        candidate = None
+        for square in rays[direction]:
+          figure = self.board[square[0] + 8*square[1]]
+          if isinstance(figure, Empty):
+            continue
+          if figure.player == player:
+            if candidate is not None:
+              break
+            candidate = figure
+          else:
+            if candidate is not None and isinstance(figure, pinning_types):
+              pinned.add(candidate)
+            break
+      self.pinned_figures[player] = pinned
+    return self.pinned_figures[player]
 
   def isPathClear(self, start_pos, end_pos):
     """
@@ -394,94 +992,15 @@ class Board:
     Return:
       Tuple of Bool and list of Objects of class Figure
     """
-    attacking_figures = []
-    king = self.kings[player]
-    # Check X direction:
-    for i in range(1, king.position[0]-1):
-      figure = self.getFigure([king.position[0]-i, king.position[1]])
-      if figure.player == player:
-        break
-      if isinstance(figure, (Rook, Queen)):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    for i in range(king.position[0]+1, 8):
-      figure = self.getFigure([i, king.position[1]])
-      if figure.player == player:
-        break
-      if isinstance(figure, (Rook, Queen)):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    # Check Y direction:
-    for i in range(1, king.position[1]-1):
-      figure = self.getFigure([king.position[0], king.position[1]-i])
-      if figure.player == player:
-        break
-      if isinstance(figure, (Rook, Queen)):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    for i in range(king.position[1]+1, 8):
-      figure = self.getFigure([king.position[0], i])
-      if figure.player == player:
-        break
-      if isinstance(figure, (Rook, Queen)):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    # Check Diagonals
-    for i in range(1, min(king.position[0]-1, king.position[1]-1)):
-      figure = self.getFigure([king.position[0]-i, king.position[1]-i])
-      if figure.player == player:
-        break
-      if figure.isValidMove(king.position):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    for i in range(1, min(8-king.position[0], 8-king.position[1])):
-      figure = self.getFigure([king.position[0]+i, king.position[1]+i])
-      if figure.player == player:
-        break
-      if figure.isValidMove(king.position):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    for i in range(1, min(king.position[0]-1, 8-king.position[1])):
-      figure = self.getFigure([king.position[0]-i, king.position[1]+i])
-      if figure.player == player:
-        break
-      if figure.isValidMove(king.position):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    for i in range(1, min(8-king.position[0], king.position[1]-1)):
-      figure = self.getFigure([king.position[0]+i, king.position[1]-i])
-      if figure.player == player:
-        break
-      if figure.isValidMove(king.position):
-        attacking_figures.append(figure)
-        break
-      if not isinstance(figure, Empty):
-        break
-    # Check for Knights
-    possible_attack_positions = [(1,2), (2, 1), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1)]
-    for position in possible_attack_positions:
-      figure = self.getFigure([king.position[0] + position[0], king.position[1] + position[1]])
-      if figure.player == player:
-        continue
-      if isinstance(figure, Knight):
-        attacking_figures.append(figure)
-        break
-    if len(attacking_figures) > 0:
-      return True, attacking_figures
+    key = (self.getHash(), 'check', player)
+    attacking_squares = QUERY_CACHE.get(key)
+    if attacking_squares is None:
+      king = self.kings[player]
+      attacking_figures = self.getAttackMap(1 - player).get(king.position, [])
+      attacking_squares = tuple(figure.position for figure in attacking_figures)
+      QUERY_CACHE.put(key, attacking_squares)
+    if len(attacking_squares) > 0:
+      return True, [self.getFigure(square) for square in attacking_squares]
     return False, []
 
   def meansCheck(self, figure, destination):
@@ -493,13 +1012,24 @@ class Board:
     Return:
       Bool
     """
-    board = Board()
+    opponent_attacks = self.getAttackMap(1 - figure.player)
+    if isinstance(figure, King):
+      # The attack map looks through the king, so no simulation is needed
+      return destination in opponent_attacks
+    if(self.kings[figure.player].position not in opponent_attacks
+        and figure not in self.getPinnedFigures(figure.player)
+        and not (isinstance(figure, Pawn) and destination[0] != figure.position[0]
+          and isinstance(self.getFigure(destination), Empty))):
+      # Neither in check, nor pinned, nor taking en passant: the move cannot expose the king
+      return False
+    board = Board(setup=False)
     board.game = self.game
-    board.board = copy.deepcopy(self.board)
+    # Let the copied figures refer to the copied board instead of copying this one
+    board.board = copy.deepcopy(self.board, {id(self): board})
     board.player_figures = [[], []]
     for i in range(8):
       for j in range(8):
-        copy_figure = board.getFigure([i, j])
+        copy_figure = board.getFigure((i, j))
         if not isinstance(copy_figure, Empty):
           board.player_figures[copy_figure.player].append(copy_figure)
         if isinstance(copy_figure, King):
@@ -510,6 +1040,38 @@ class Board:
     is_check, _ = board.isCheck(figure.player)
     return is_check
 
+  def getMoveFlags(self, start, destination):
+    """
+    Get the kind of a move, before it is made
+    Input:
+      start: Tuple of Int
+      destination: Tuple of Int
+    Return:
+      Int                           - NORMAL, PROMOTION, EN_PASSANT or CASTLING
+    """
+    figure = self.getFigure(start)
+    if isinstance(figure, King) and abs(destination[0] - start[0]) == 2:
+      return CASTLING
+    if isinstance(figure, Pawn):
+      if destination[1] in (0, 7):
+        return PROMOTION
+      if destination[0] != start[0] and isinstance(self.getFigure(destination), Empty):
+        return EN_PASSANT
+    return NORMAL
+
+  def encodeMove(self, start, destination, promotion_str=''):
+    """
+    Pack a move of this position into an Int, including its kind
+    Input:
+      start: Tuple of Int
+      destination: Tuple of Int
+      promotion_str: String
+    Return:
+      Int (see encodeMove())
+    Raises ValueError if a pawn reaches the last row without a promotion string
+    """
+    return encodeMove(start, destination, promotion_str, self.getMoveFlags(start, destination))
+
   def getFigure(self, position):
     """
     Get the figure at position
@@ -520,7 +1082,7 @@ class Board:
     """
     if not isOnBoard(position):
       return Empty(self, position)
-    return self.board[position[0]][position[1]]
+    return self.board[position[0] + 8*position[1]]
 
   def update(self, figure, destination, promotion_str=''):
     """
@@ -532,11 +1094,12 @@ class Board:
     Return:
       None
     """
-    old_position = [figure.position[0], figure.position[1]]
+    old_position = figure.position
     if isinstance(figure, Pawn) and figure.isEnPassant(destination):
       old_figure_position = destination[0], figure.position[1]
       old_figure = self.getFigure(old_figure_position)
-      self.board[old_figure_position[0]][old_figure_position[1]] = Empty(self, old_figure_position)
+      index = old_figure_position[0] + 8*old_figure_position[1]
+      self.board[index] = self.empty_squares[index]
     else:
       old_figure = self.getFigure(destination)
     if isinstance(figure, Pawn):
@@ -561,9 +1124,11 @@ class Board:
       except ValueError:
         # Happens when called for the copy generated from meansCheck(), irrelevant case
         pass
-    self.board[destination[0]][destination[1]] = figure
-    self.board[old_position[0]][old_position[1]] = Empty(self, old_position)
+    self.board[destination[0] + 8*destination[1]] = figure
+    index = old_position[0] + 8*old_position[1]
+    self.board[index] = self.empty_squares[index]
     figure.position = destination
+    self.invalidate()
     return old_figure
 
   def move(self, player, start_pos, end_pos, promotion_str):
@@ -582,9 +1147,21 @@ class Board:
     figure = self.getFigure(start_pos)
     if figure.player != player:
       return False, None
+    if isinstance(figure, Pawn) and end_pos[1] in (0, 7) and promotion_str not in PROMOTION_STRS:
+      # A pawn reaching the last row has to be promoted
+      return False, None
     if not figure.move(end_pos):
       return False, None
-    return True, self.update(figure, end_pos, promotion_str)
+    is_pawn = isinstance(figure, Pawn)
+    taken_figure = self.update(figure, end_pos, promotion_str)
+    # Counted here instead of in update(), which also moves the rook when castling
+    if is_pawn or not isinstance(taken_figure, Empty):
+      self.halfmove_clock = 0
+    else:
+      self.halfmove_clock += 1
+    if player == 1:
+      self.fullmove_number += 1
+    return True, taken_figure
 
   def isCheckmateSingle(self, player, attacking_figure):
     """
@@ -612,23 +1189,23 @@ class Board:
       if x_diff == 0:
         for y_iter in range(1, abs(king.position[1]-attacking_figure.position[1])+1):
           y_pos = king.position[1] + y_factor * y_iter
-          possible_defense_positions.append([king.position[0], y_pos])
+          possible_defense_positions.append((king.position[0], y_pos))
       elif y_diff == 0:
         for x_iter in range(1, abs(king.position[0]-attacking_figure.position[0])+1):
           x_pos = king.position[0] + x_factor * x_iter
-          possible_defense_positions.append([x_pos, king.position[1]])
+          possible_defense_positions.append((x_pos, king.position[1]))
       else:
         for i in range(1, abs(king.position[0]-attacking_figure.position[0])+1):
           x_pos = king.position[0] + x_factor * i
           y_pos = king.position[1] + y_factor * i
-          possible_defense_positions.append([x_pos, y_pos])
+          possible_defense_positions.append((x_pos, y_pos))
     # Check if any defense position is possible
     for position in possible_defense_positions:
       for figure in self.player_figures[player]:
         if figure.isValidMove(position):
           return False
     for move in king.possible_moves:
-      destination = [king.position[0] + move[0], king.position[1] + move[1]]
+      destination = (king.position[0] + move[0], king.position[1] + move[1])
       if king.isValidMove(destination):
         return False
     return True
@@ -638,12 +1215,22 @@ class Board:
     Check if the attacking figures create a checkmate situation
     Input:
       player: Int
-      attacking_figures: List of Objects of class Figure
+      attacking_figures: List of Objects of class Figure - as returned by isCheck()
+    Return:
+      Bool
     """
-    for figure in attacking_figures:
-      if self.isCheckmateSingle(player, figure):
-        return True
-    return False
+    if len(attacking_figures) == 0:
+      return False
+    key = (self.getHash(), 'checkmate', player)
+    is_checkmate = QUERY_CACHE.get(key)
+    if is_checkmate is None:
+      is_checkmate = False
+      for figure in attacking_figures:
+        if self.isCheckmateSingle(player, figure):
+          is_checkmate = True
+          break
+      QUERY_CACHE.put(key, is_checkmate)
+    return is_checkmate
 
   def isStaleMate(self, player):
     """
@@ -653,10 +1240,16 @@ class Board:
     Return:
       Bool
     """
-    for figure in self.player_figures[player]:
-      if figure.canMove():
-        return False
-    return True
+    key = (self.getHash(), 'stalemate', player)
+    is_stalemate = QUERY_CACHE.get(key)
+    if is_stalemate is None:
+      is_stalemate = True
+      for figure in self.player_figures[player]:
+        if figure.canMove():
+          is_stalemate = False
+          break
+      QUERY_CACHE.put(key, is_stalemate)
+    return is_stalemate
 
   def printBoard(self):
     """
@@ -676,14 +1269,26 @@ class Board:
     print('')
     print('    a b c d e f g h')
 
+FIGURE_CLASSES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+
 class ChessGame:
   """Class for the Chess Game"""
-  def __init__(self):
-    self.board = Board()
+  def __init__(self, fen=None):
+    """
+    Create a game
+    Input:
+      fen: String                   - Position to start from, the initial position if None
+    """
+    self.board = Board(setup=fen is None)
     self.board.game = self
     self.current_player = 0
+    # Packed moves (see encodeMove()) and the figures they took
     self.history = []
     self.fide_history = []
+    # Moved figure, its former has_moved flag and the halfmove clock before each move
+    self.undo_history = []
+    if fen is not None:
+      self.setFEN(fen)
 
   def printBoard(self):
     """Print the current board setup"""
@@ -696,13 +1301,18 @@ class ChessGame:
     Return:
       Tuple of Int
     """
-    player_0_score = 0
-    player_1_score = 0
-    for figure in self.board.player_figures[0]:
-      player_0_score += figure.value
-    for figure in self.board.player_figures[1]:
-      player_1_score += figure.value
-    return player_0_score, player_1_score
+    key = (self.board.getHash(), 'scores')
+    scores = QUERY_CACHE.get(key)
+    if scores is None:
+      player_0_score = 0
+      player_1_score = 0
+      for figure in self.board.player_figures[0]:
+        player_0_score += figure.value
+      for figure in self.board.player_figures[1]:
+        player_1_score += figure.value
+      scores = (player_0_score, player_1_score)
+      QUERY_CACHE.put(key, scores)
+    return scores
 
   def isDraw(self):
     """
@@ -718,31 +1328,64 @@ class ChessGame:
     except IndexError:
       # Not enough moves
       pass
-    if len(self.fide_history) > 75:
-      # Check if within the last 75 moves a pawn was moved
-      # or a figure was taken
-      draw = True
-      for move in self.fide_history[-75:]:
-        if move[0] in ['R', 'N', 'B', 'Q', 'K'] or 'x' in move:
-          draw = False
-          break
-      if draw:
-        return True
+    if self.board.halfmove_clock >= 150:
+      # Seventy-five-move rule
+      return True
     return self.board.isStaleMate(self.current_player)
 
+  def canClaimDraw(self):
+    """
+    Check if a player may claim a draw by the fifty-move rule
+    Input:
+    Return:
+      Bool
+    """
+    return self.board.halfmove_clock >= 100
+
   def undo(self):
     """
     Undo the last move
     Input:
     Return:
+      Bool                          - False if there is no move to undo
     """
-    # TODO Undo promotion
-    last_move = self.history.pop()
+    if len(self.undo_history) == 0:
+      return False
+    moved_figure, had_moved, halfmove_clock = self.undo_history.pop()
+    move, taken_figure = self.history.pop()
+    start, destination = getMoveStart(move), getMoveDestination(move)
     self.fide_history.pop()
-    moved_figure = self.board.getFigure(last_move[0][0])
-    taken_figure = last_move[1]
-    self.board.update(taken_figure, last_move[0][0])
-    self.board.update(moved_figure, last_move[0][1])
+    board = self.board
+    figure = board.getFigure(destination)
+    if figure is not moved_figure:
+      # Undo the promotion
+      board.player_figures[figure.player].remove(figure)
+      board.player_figures[moved_figure.player].append(moved_figure)
+    board.board[squareIndex(destination)] = board.empty_squares[squareIndex(destination)]
+    board.board[squareIndex(start)] = moved_figure
+    moved_figure.position = start
+    moved_figure.has_moved = had_moved
+    if not isinstance(taken_figure, Empty):
+      # The position of a figure taken en passant differs from the destination
+      board.board[squareIndex(taken_figure.position)] = taken_figure
+      board.player_figures[taken_figure.player].append(taken_figure)
+    if getMoveFlags(move) == CASTLING:
+      # Put the rook of the rochade back
+      if destination[0] > start[0]:
+        rook_position, rook_start = (start[0]+1, start[1]), (7, start[1])
+      else:
+        rook_position, rook_start = (start[0]-1, start[1]), (0, start[1])
+      rook = board.getFigure(rook_position)
+      board.board[squareIndex(rook_position)] = board.empty_squares[squareIndex(rook_position)]
+      board.board[squareIndex(rook_start)] = rook
+      rook.position = rook_start
+      rook.has_moved = False
+    self.current_player = moved_figure.player
+    board.halfmove_clock = halfmove_clock
+    if moved_figure.player == 1:
+      board.fullmove_number -= 1
+    board.invalidate()
+    return True
 
   def getBoard(self):
     """Get a representation of the board for computer-evaluation"""
@@ -752,14 +1395,23 @@ class ChessGame:
         board[i][j] = self.board.getFigure((i,j)).getID()
     return board
 
-  def translateFromFIDE(self, fide_str):
+  def parseFIDE(self, fide_str):
     """
-    Translate the FIDE move to the internal representation
+    Split a move in FIDE notation into its parts, without looking at the figures
     Input:
       fide_str: String
     Return:
-      Tuple of (Tuple of Tuple of Int) and Str
+      Tuple of String, Int, Int, Tuple of Int and String
+        figure name ('p' for pawns), column and row given for disambiguation
+        (None if not given), destination and promotion string
     """
+    # Clear the check and checkmate markers
+    fide_str = fide_str.rstrip('+#')
+    if fide_str in ['O-O', 'O-O-O', '0-0', '0-0-0']:
+      row = 0 if self.current_player == 0 else 7
+      if len(fide_str) == 3:
+        return 'k', None, None, (6, row), ''
+      return 'k', None, None, (2, row), ''
     # Get figure string
     if fide_str[0] in ['R', 'N', 'B', 'Q', 'K']:
       figure_str = fide_str[0].lower()
@@ -791,13 +1443,24 @@ class ChessGame:
       else:
         disamb_column = ord(fide_str[0]) - 97
         disamb_row = int(fide_str) - 1
+    destination = (ord(dest_str[0])-97, int(dest_str[1])-1)
+    return figure_str, disamb_column, disamb_row, destination, promotion_str
+
+  def translateFromFIDE(self, fide_str):
+    """
+    Translate the FIDE move to the internal representation
+    Input:
+      fide_str: String
+    Return:
+      Tuple of (Tuple of Tuple of Int) and Str
+    """
+    figure_str, disamb_column, disamb_row, destination, promotion_str = self.parseFIDE(fide_str)
     # Get all figures with that figure string
     possible_figures = []
     for figure in self.board.player_figures[self.current_player]:
       if figure.name == figure_str:
         possible_figures.append(figure)
     # Disambiguate
-    destination = (ord(dest_str[0])-97, int(dest_str[1])-1)
     moved_figure = None
     if len(possible_figures) > 1:
       if isinstance(possible_figures[0], Pawn):
@@ -806,39 +1469,40 @@ class ChessGame:
             if figure.position[0] == disamb_column and figure.isValidMove(destination):
               moved_figure = figure
               break
-          elif figure.position[0] == ord(dest_str[0]) - 97 and figure.isValidMove(destination):
+          elif figure.position[0] == destination[0] and figure.isValidMove(destination):
             moved_figure = figure
             break
       else:
         for figure in possible_figures:
-          if(disamb_column is not None and disamb_row is not None
-              and figure.position == (disamb_column, disamb_row)):
-            moved_figure = figure
-            break
-          if disamb_column is not None and figure.position[0] == disamb_column:
-            moved_figure = figure
-            break
-          if disamb_row is not None and figure.position[1] == disamb_row:
-            moved_figure = figure
-            break
+          if disamb_column is not None and figure.position[0] != disamb_column:
+            continue
+          if disamb_row is not None and figure.position[1] != disamb_row:
+            continue
           if figure.isValidMove(destination):
             moved_figure = figure
             break
-    else:
+    elif len(possible_figures) == 1:
       moved_figure = possible_figures[0]
     if not moved_figure:
       raise NoFigureException()
     return moved_figure.position, destination, promotion_str
 
-  def translateToFIDE(self, move, moved_figure, taken_figure, is_check, is_checkmate):
+  def translateToFIDE(self, move, moved_figure, taken_figure, is_check, is_checkmate, ambiguous_figures=None):
     """
-    Translate the move to FIDE standard
+    Translate the move to FIDE standard (called after the move was made)
     Input:
       move: Tuple of Tuple of int
+      moved_figure: Object of class Figure
       taken_figure: Object of class Figure
+      is_check: Bool
+      is_checkmate: Bool
+      ambiguous_figures: List of Objects of class Figure - Other figures that could
+                                                           have moved to the destination
     Return:
       String
     """
+    if ambiguous_figures is None:
+      ambiguous_figures = []
     promotion_str = ''
     if isinstance(moved_figure, Pawn):
       fig_str = ''
@@ -848,16 +1512,13 @@ class ChessGame:
         promotion_str = self.board.getFigure(move[1]).name.upper()
     else:
       fig_str = moved_figure.name.upper()
-      for figure in self.board.player_figures[moved_figure.player]:
-        ambigous_figures = []
-        if figure.name == moved_figure.name:
-          if figure.isValidMove(move[1]):
-            ambigous_figures.append(figure)
-        for ambigous_figure in ambigous_figures:
-          if ambigous_figure.position[0] == move[0][0]:
-            fig_str += chr(move[0][0]+97)
-          if ambigous_figure.position[1] == move[0][1]:
-            fig_str += str(move[0][1]+1)
+      if len(ambiguous_figures) > 0:
+        if all(figure.position[0] != move[0][0] for figure in ambiguous_figures):
+          fig_str += chr(move[0][0]+97)
+        elif all(figure.position[1] != move[0][1] for figure in ambiguous_figures):
+          fig_str += str(move[0][1]+1)
+        else:
+          fig_str += chr(move[0][0]+97) + str(move[0][1]+1)
     if not isinstance(taken_figure, Empty):
       taken_str = 'x'
       if isinstance(moved_figure, Pawn):
@@ -865,11 +1526,10 @@ class ChessGame:
     else:
       taken_str = ''
     dest_str = chr(move[1][0] + 97) + str(move[1][1]+1)
-    if isinstance(moved_figure, King):
-      if move[0][0] - move[1][0] == -2:
-        fide_str = 'O-O-O'
-      elif move[0][0] - move[1][0] == 2:
-        fide_str = 'O-O'
+    if isinstance(moved_figure, King) and move[0][0] - move[1][0] == -2:
+      fide_str = 'O-O'
+    elif isinstance(moved_figure, King) and move[0][0] - move[1][0] == 2:
+      fide_str = 'O-O-O'
     else:
       fide_str = fig_str + taken_str + dest_str + promotion_str
     if is_checkmate:
@@ -895,20 +1555,43 @@ class ChessGame:
     """
     try:
       start, destination, promotion_str = self.translateFromFIDE(fide_str)
-    except (IndexError, NoFigureException):
+    except (IndexError, ValueError, NoFigureException):
       return -1
-    # moved_figure = self.board.getFigure(move[0])
+    return self.moveCoordinates(start, destination, promotion_str, fide_str)
+
+  def moveCoordinates(self, start, destination, promotion_str='', fide_str=None):
+    """
+    Move the figure on start to destination
+    Input:
+      start: Tuple of Int
+      destination: Tuple of Int
+      promotion_str: String         - If pawn reaches 'finish-line', promote it
+      fide_str: String              - The move in FIDE notation, generated if None
+    Return:
+      Int (see move())
+    """
+    moved_figure = self.board.getFigure(start)
+    undo_info = (moved_figure, moved_figure.has_moved, self.board.halfmove_clock)
+    flags = self.board.getMoveFlags(start, destination)
+    if fide_str is None:
+      ambiguous_figures = [figure for figure in self.board.player_figures[self.current_player]
+          if figure is not moved_figure and figure.name == moved_figure.name
+          and not isinstance(figure, Pawn) and figure.isValidMove(destination)]
     retval, taken_figure = self.board.move(self.current_player, start, destination, promotion_str)
     if not retval:
       return -1
-    self.history.append(((start, destination), taken_figure))
+    self.history.append((encodeMove(start, destination, promotion_str if flags == PROMOTION else '', flags),
+        taken_figure))
+    self.undo_history.append(undo_info)
     if self.current_player == 1:
       self.current_player = 0
     else:
       self.current_player = 1
     is_check, attacking_figures = self.board.isCheck(self.current_player)
     is_checkmate = self.board.isCheckmate(self.current_player, attacking_figures)
-    # fide_str = self.translateToFIDE(move, moved_figure, taken_figure, is_check, is_checkmate)
+    if fide_str is None:
+      fide_str = self.translateToFIDE((start, destination), moved_figure, taken_figure,
+          is_check, is_checkmate, ambiguous_figures)
     self.fide_history.append(fide_str)
     if is_check:
       if is_checkmate:
@@ -921,3 +1604,244 @@ class ChessGame:
     if self.isDraw():
       return 5
     return 0
+
+  def encodeFIDE(self, fide_str):
+    """
+    Pack a move given in FIDE notation into an Int, without making it
+    Input:
+      fide_str: String
+    Return:
+      Int (see encodeMove())
+    Raises ValueError if a pawn reaches the last row without a promotion figure
+    """
+    start, destination, promotion_str = self.translateFromFIDE(fide_str)
+    return self.board.encodeMove(start, destination, promotion_str)
+
+  def encodeCoordinates(self, move_str):
+    """
+    Pack a move given in coordinate notation (e.g. 'e2e4', 'e7e8q') into an Int
+    Input:
+      move_str: String
+    Return:
+      Int (see encodeMove())
+    Raises ValueError if a pawn reaches the last row without a promotion figure
+    """
+    return self.board.encodeMove(*coordinatesToMove(move_str))
+
+  def decodeToFIDE(self, move):
+    """
+    Get the FIDE notation of a packed move by making and undoing it
+    Input:
+      move: Int
+    Return:
+      String, None if the move is invalid
+    """
+    if self.moveEncoded(move) == -1:
+      return None
+    fide_str = self.fide_history[-1]
+    self.undo()
+    return fide_str
+
+  def moveEncoded(self, move):
+    """
+    Make a packed move
+    Input:
+      move: Int
+    Return:
+      Int (see move())
+    """
+    start, destination, promotion_str = decodeMove(move)
+    return self.moveCoordinates(start, destination, promotion_str)
+
+  def getLegalMoves(self):
+    """
+    Get all valid moves of the current player
+    Input:
+    Return:
+      List of Tuple of (Tuple of Int, Tuple of Int, String) - start, destination and promotion
+    """
+    return self.board.getLegalMoves(self.current_player)
+
+  def getEncodedLegalMoves(self):
+    """
+    Get all valid moves of the current player, packed into Ints
+    Input:
+    Return:
+      List of Int (see encodeMove())
+    """
+    return [self.board.encodeMove(start, destination, promotion_str)
+        for start, destination, promotion_str in self.getLegalMoves()]
+
+  def getHash(self):
+    """
+    Get the Zobrist hash of the current position, including the player to move
+    Input:
+    Return:
+      Int
+    """
+    if self.current_player == 1:
+      return self.board.getHash() ^ getZobristKeys()['player']
+    return self.board.getHash()
+
+  def getFEN(self):
+    """
+    Get the current position in Forsyth-Edwards Notation
+    Input:
+    Return:
+      String
+    """
+    rows = []
+    for y in range(7, -1, -1):
+      row = ''
+      empty = 0
+      for x in range(8):
+        figure = self.board.getFigure((x, y))
+        if isinstance(figure, Empty):
+          empty += 1
+          continue
+        if empty > 0:
+          row += str(empty)
+          empty = 0
+        row += figure.name.upper() if figure.player == 0 else figure.name
+      if empty > 0:
+        row += str(empty)
+      rows.append(row)
+    en_passant = self.board.getEnPassantSquare()
+    if en_passant is None:
+      en_passant_str = '-'
+    else:
+      en_passant_str = chr(en_passant[0] + 97) + str(en_passant[1] + 1)
+    return ' '.join(['/'.join(rows), 'wb'[self.current_player],
+        self.board.getCastlingRights(), en_passant_str,
+        str(self.board.halfmove_clock), str(self.board.fullmove_number)])
+
+  def setFEN(self, fen):
+    """
+    Set up the position given in Forsyth-Edwards Notation. The history is cleared
+    Input:
+      fen: String
+    Return:
+    """
+    fields = fen.split()
+    self.board.clear()
+    for row, row_str in enumerate(fields[0].split('/')):
+      y = 7 - row
+      x = 0
+      for char in row_str:
+        if char.isdigit():
+          x += int(char)
+          continue
+        player = 0 if char.isupper() else 1
+        figure = FIGURE_CLASSES[char.lower()](self.board, (x, y), player)
+        # Only pawns on their initial row may still move two squares
+        figure.has_moved = not isinstance(figure, Pawn) or y != (1 if player == 0 else 6)
+        self.board.placeFigure(figure)
+        x += 1
+    castling_str = fields[2] if len(fields) > 2 else '-'
+    for right in castling_str.replace('-', ''):
+      player = 0 if right.isupper() else 1
+      row = 0 if player == 0 else 7
+      column = 7 if right.upper() == 'K' else 0
+      self.board.kings[player].has_moved = False
+      self.board.getFigure((column, row)).has_moved = False
+    self.current_player = 0 if len(fields) < 2 or fields[1] == 'w' else 1
+    self.board.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+    self.board.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+    self.history = []
+    self.fide_history = []
+    self.undo_history = []
+    if len(fields) > 3 and fields[3] != '-':
+      # Recreate the double step of the pawn, so that it can be taken en passant
+      x = ord(fields[3][0]) - 97
+      y = int(fields[3][1]) - 1
+      direction = 1 if y == 2 else -1
+      self.history.append((encodeMove((x, y - direction), (x, y + direction)),
+          self.board.empty_squares[squareIndex((x, y + direction))]))
+    self.board.invalidate()
+
+  def findLegalMove(self, fide_str, legal_moves):
+    """
+    Find the move given in FIDE notation among the valid moves of the position.
+    Like move(), a promotion figure given for a move that is no promotion is ignored
+    Input:
+      fide_str: String
+      legal_moves: List of Tuple    - as returned by getLegalMoves()
+    Return:
+      Tuple of (Tuple of Int, Tuple of Int, String), None if the move is invalid
+    """
+    try:
+      figure_str, disamb_column, disamb_row, destination, promotion_str = self.parseFIDE(fide_str)
+    except (IndexError, ValueError):
+      return None
+    for move in legal_moves:
+      start = move[0]
+      if move[1] != destination or move[2] != '' and move[2] != promotion_str:
+        continue
+      if self.board.getFigure(start).name != figure_str:
+        continue
+      if disamb_column is not None and start[0] != disamb_column:
+        continue
+      if disamb_row is not None and start[1] != disamb_row:
+        continue
+      if figure_str == 'p' and disamb_column is None and start[0] != destination[0]:
+        # Pawns only take with the column given
+        continue
+      return move
+    return None
+
+  def validateMoves(self, fide_strs):
+    """
+    Validate several moves on the current position without changing it.
+    The valid moves of the position are generated once and every move is
+    looked up among them, so only valid moves are made, each on its own
+    copy of the game. Identical moves are looked up and made once, every
+    further occurrence gets its own copy of the resulting game.
+    Input:
+      fide_strs: List of String
+    Return:
+      List of Tuple of Int and Object of class ChessGame
+        Int: Return value of move() (-1: Invalid move)
+        ChessGame: Game after the move, None if the move is invalid
+    """
+    legal_moves = self.getLegalMoves()
+    results = {}
+    for fide_str in fide_strs:
+      if fide_str in results:
+        continue
+      move = self.findLegalMove(fide_str, legal_moves)
+      if move is None:
+        results[fide_str] = (-1, None)
+        continue
+      scratch = copy.deepcopy(self)
+      start, destination, promotion_str = move
+      results[fide_str] = (scratch.moveCoordinates(start, destination, promotion_str, fide_str), scratch)
+    validated = []
+    returned = set()
+    for fide_str in fide_strs:
+      retval, game = results[fide_str]
+      if game is not None and fide_str in returned:
+        game = copy.deepcopy(game)
+      returned.add(fide_str)
+      validated.append((retval, game))
+    return validated
+
+def validateMoves(games_and_moves):
+  """
+  Validate many moves on many games at once, grouping the moves by game
+  so that every position is only prepared once
+  Input:
+    games_and_moves: List of Tuple of Object of class ChessGame and String
+  Return:
+    List of Tuple of Int and Object of class ChessGame (see ChessGame.validateMoves)
+  """
+  results = [None] * len(games_and_moves)
+  grouped = {}
+  for index, (game, fide_str) in enumerate(games_and_moves):
+    if id(game) not in grouped:
+      grouped[id(game)] = (game, [])
+    grouped[id(game)][1].append(index)
+  for game, indices in grouped.values():
+    game_results = game.validateMoves([games_and_moves[index][1] for index in indices])
+    for index, result in zip(indices, game_results):
+      results[index] = result
+  return results
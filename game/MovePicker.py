@@ -0,0 +1,179 @@
+"""
+Staged move generation for searches: moves are generated and ordered in
+stages, and a stage is only generated when the previous one is exhausted
+"""
+
+from game.ChessGame import Empty, Pawn
+
+HASH_MOVE = 0
+GENERATE_CAPTURES = 1
+CAPTURES = 2
+KILLERS = 3
+GENERATE_QUIETS = 4
+QUIETS = 5
+BAD_CAPTURES = 6
+DONE = 7
+
+class MovePicker:
+  """
+  Hands out the valid moves of the player to move one at a time: first the
+  hash move, then captures by MVV-LVA (most valuable victim, least valuable
+  attacker), then the killer moves, the quiet moves ordered by their history
+  score and finally the captures losing material by static exchange evaluation
+  """
+  def __init__(self, game, hash_move=None, killers=(), history=None, captures_only=False):
+    """
+    Create a picker for the current position of the game
+    Input:
+      game: Object of class ChessGame
+      hash_move: Tuple of (Tuple of Int, Tuple of Int, String) - Best move from the transposition table
+      killers: List of Tuple        - Quiet moves that caused cut-offs at the same ply
+      history: Dict of Tuple of (Tuple of Int, Tuple of Int) to Int - History scores of quiet moves
+      captures_only: Bool           - Only hand out the captures not losing material
+    """
+    self.board = game.board
+    self.player = game.current_player
+    self.hash_move = hash_move
+    self.killers = list(killers)
+    self.history = history if history is not None else {}
+    self.captures_only = captures_only
+    self.stage = HASH_MOVE
+    self.moves = []
+    self.index = 0
+    self.returned = set()
+    self.bad_captures = []
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    move = self.nextMove()
+    if move is None:
+      raise StopIteration
+    return move
+
+  def isValid(self, move):
+    """
+    Check if a move taken from outside the picker is valid in this position
+    Input:
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+    Return:
+      Bool
+    """
+    start, destination, promotion_str = move
+    figure = self.board.getFigure(start)
+    if figure.player != self.player:
+      return False
+    if isinstance(figure, Pawn) and destination[1] in (0, 7):
+      if promotion_str not in ('Q', 'R', 'B', 'N'):
+        return False
+    elif promotion_str != '':
+      return False
+    return figure.isValidMove(destination)
+
+  def isCapture(self, figure, destination):
+    """
+    Check if moving the figure to destination takes a figure
+    Input:
+      figure: Object of class Figure
+      destination: Tuple of Int
+    Return:
+      Bool
+    """
+    target = self.board.getFigure(destination)
+    if not isinstance(target, Empty):
+      return target.player != figure.player
+    return (isinstance(figure, Pawn) and destination[0] != figure.position[0]
+        and figure.isEnPassant(destination))
+
+  def generate(self, captures):
+    """
+    Generate the moves of one stage, without checking their validity
+    Input:
+      captures: Bool                - Generate the captures, else the quiet moves
+    Return:
+      List of Tuple of (Tuple of Int, Tuple of Int, String)
+    """
+    moves = []
+    for figure in self.board.player_figures[self.player]:
+      start = figure.position
+      for destination in self.board.getCandidateDestinations(figure):
+        if self.isCapture(figure, destination) != captures:
+          continue
+        if isinstance(figure, Pawn) and destination[1] in (0, 7):
+          for promotion_str in ('Q', 'R', 'B', 'N'):
+            moves.append((start, destination, promotion_str))
+        else:
+          moves.append((start, destination, ''))
+    return moves
+
+  def captureScore(self, move):
+    """
+    MVV-LVA score of a capture, higher is better
+    Input:
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+    Return:
+      Int
+    """
+    victim = self.board.getFigure(move[1])
+    attacker = self.board.getFigure(move[0])
+    # Taking en passant leaves the destination empty, the victim is a pawn
+    victim_value = victim.value if not isinstance(victim, Empty) else 1
+    return 1000*victim_value - attacker.value
+
+  def nextMove(self):
+    """
+    Get the next valid move
+    Input:
+    Return:
+      Tuple of (Tuple of Int, Tuple of Int, String), None if there are no more moves
+    """
+    while True:
+      if self.stage == HASH_MOVE:
+        self.stage = GENERATE_CAPTURES
+        if self.hash_move is not None and self.isValid(self.hash_move):
+          self.returned.add(self.hash_move)
+          return self.hash_move
+      elif self.stage == GENERATE_CAPTURES:
+        self.moves = sorted(self.generate(True), key=self.captureScore, reverse=True)
+        self.index = 0
+        self.stage = CAPTURES
+      elif self.stage in [CAPTURES, QUIETS, BAD_CAPTURES]:
+        while self.index < len(self.moves):
+          move = self.moves[self.index]
+          self.index += 1
+          if move in self.returned:
+            continue
+          if self.stage == CAPTURES and self.board.staticExchange(move) < 0:
+            self.bad_captures.append(move)
+            continue
+          if self.board.getFigure(move[0]).isValidMove(move[1]):
+            return move
+        if self.stage == CAPTURES and self.captures_only:
+          self.stage = DONE
+        elif self.stage == CAPTURES:
+          self.moves = list(self.killers)
+          self.index = 0
+          self.stage = KILLERS
+        elif self.stage == QUIETS:
+          self.moves = self.bad_captures
+          self.index = 0
+          self.stage = BAD_CAPTURES
+        else:
+          self.stage = DONE
+      elif self.stage == KILLERS:
+        while self.index < len(self.moves):
+          move = self.moves[self.index]
+          self.index += 1
+          if(move not in self.returned and self.isValid(move)
+              and not self.isCapture(self.board.getFigure(move[0]), move[1])):
+            self.returned.add(move)
+            return move
+        self.stage = GENERATE_QUIETS
+      elif self.stage == GENERATE_QUIETS:
+        self.moves = sorted(self.generate(False),
+            key=lambda move: self.history.get((move[0], move[1]), 0), reverse=True)
+        self.index = 0
+        self.stage = QUIETS
+      else:
+        return None
@@ -0,0 +1,398 @@
+"""
+A reference AI for the game, searching the game tree with alpha-beta.
+The root moves can be split across a pool of processes, which share
+a transposition table in shared memory
+"""
+
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from game.ChessGame import ChessGame, encodeMove, decodeMove, moveToCoordinates
+from game.MovePicker import MovePicker
+
+class SearchStopped(Exception):
+  def __init__(self, message = 'Search stopped'):
+    super().__init__(message)
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+class TranspositionTable:
+  """
+  Transposition table stored in shared memory. Entries are written without
+  locking; every entry stores its key XOR its data, so that entries torn by
+  concurrent writes are detected and ignored on lookup
+  """
+  entry = struct.Struct('<QQ')
+
+  def __init__(self, size=2**16, name=None):
+    self.size = size
+    self.owner = name is None
+    self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size*self.entry.size)
+    if self.owner:
+      self.memory.buf[:] = bytes(size*self.entry.size)
+    self.name = self.memory.name
+
+  def lookup(self, key):
+    """
+    Look up the entry of a position
+    Input:
+      key: Int                      - Zobrist hash of the position
+    Return:
+      Tuple of (Int, Int, Int, Tuple) - depth, score, flag and best move, None if not found
+    """
+    checksum, data = self.entry.unpack_from(self.memory.buf, (key % self.size) * self.entry.size)
+    if data == 0 or checksum ^ data != key:
+      return None
+    score = (data & 0xffffffff) - 2**31
+    depth = (data >> 32) & 0xff
+    flag = (data >> 40) & 0x3
+    return depth, score, flag, decodeMove((data >> 42) & 0xffff)
+
+  def store(self, key, depth, score, flag, move):
+    """
+    Store the result of a search
+    Input:
+      key: Int
+      depth: Int
+      score: Int
+      flag: Int                     - EXACT, LOWER_BOUND or UPPER_BOUND
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+    Return:
+    """
+    data = (score + 2**31) | depth << 32 | flag << 40 | encodeMove(*move) << 42
+    self.entry.pack_into(self.memory.buf, (key % self.size) * self.entry.size, key ^ data, data)
+
+  def close(self):
+    """Detach from the shared memory, and free it if this table created it"""
+    self.memory.close()
+    if self.owner:
+      self.memory.unlink()
+
+class SearchAI:
+  """Alpha-beta search on top of ChessGame"""
+  def __init__(self, depth=3, processes=1, table_size=2**16, table=None):
+    self.depth = depth
+    self.processes = processes
+    if table is None:
+      table = TranspositionTable(table_size)
+    self.table = table
+    self.pool = None
+    self.nodes = 0
+    self.stats = {}
+    # Set by stop(), or by whoever passed it to getMove()
+    self.stop_event = threading.Event()
+    self.deadline = None
+    # Quiet moves that caused cut-offs, per ply, and history scores of quiet moves
+    self.killers = []
+    self.history = {}
+    # Called with the stats after every finished iteration
+    self.info_callback = None
+
+  def evaluate(self, game):
+    """
+    Evaluate the position from the view of the player to move
+    Input:
+      game: Object of class ChessGame
+    Return:
+      Int
+    """
+    scores = game.getScores()
+    return scores[game.current_player] - scores[1 - game.current_player]
+
+  def orderMoves(self, game, moves, hash_move):
+    """
+    Sort the moves so that the most promising ones are searched first
+    Input:
+      game: Object of class ChessGame
+      moves: List of Tuple of (Tuple of Int, Tuple of Int, String)
+      hash_move: Tuple of (Tuple of Int, Tuple of Int, String), None if unknown
+    Return:
+      List of Tuple of (Tuple of Int, Tuple of Int, String)
+    """
+    def key(move):
+      if move == hash_move:
+        return -INFINITY
+      taken_figure = game.board.getFigure(move[1])
+      return -10*taken_figure.value + game.board.getFigure(move[0]).value
+    return sorted(moves, key=key)
+
+  def playMove(self, game, move):
+    """
+    Play the move on a copy of the game. The copy is set up from the FEN
+    of the game, which is much cheaper than a deep copy of all figures
+    Input:
+      game: Object of class ChessGame
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+    Return:
+      Tuple of Object of class ChessGame and Int (return value of ChessGame.move())
+    """
+    child = ChessGame(game.getFEN())
+    retval = child.moveCoordinates(move[0], move[1], move[2], moveToCoordinates(*move))
+    return child, retval
+
+  def search(self, game, depth, alpha, beta, ply=0):
+    """
+    Negamax alpha-beta search
+    Input:
+      game: Object of class ChessGame
+      depth: Int
+      alpha: Int
+      beta: Int
+      ply: Int                      - Distance to the root
+    Return:
+      Int                           - Score from the view of the player to move
+    """
+    self.nodes += 1
+    if self.isStopped():
+      raise SearchStopped()
+    if depth == 0:
+      return self.quiescence(game, alpha, beta)
+    key = game.getHash()
+    entry = self.table.lookup(key)
+    hash_move = None
+    if entry is not None:
+      entry_depth, entry_score, entry_flag, hash_move = entry
+      if ply > 0 and entry_depth >= depth:
+        if(entry_flag == EXACT
+            or entry_flag == LOWER_BOUND and entry_score >= beta
+            or entry_flag == UPPER_BOUND and entry_score <= alpha):
+          return entry_score
+    original_alpha = alpha
+    best_score = -INFINITY
+    best_move = None
+    while len(self.killers) <= ply:
+      self.killers.append([])
+    picker = MovePicker(game, hash_move, self.killers[ply], self.history)
+    for move in picker:
+      child, retval = self.playMove(game, move)
+      if retval in [3, 4]:
+        score = MATE_SCORE - ply - 1
+      elif retval == 5:
+        score = 0
+      else:
+        score = -self.search(child, depth - 1, -beta, -alpha, ply + 1)
+      if score > best_score:
+        best_score = score
+        best_move = move
+      alpha = max(alpha, score)
+      if alpha >= beta:
+        if not picker.isCapture(game.board.getFigure(move[0]), move[1]):
+          self.storeKiller(move, ply, depth)
+        break
+    if best_move is None:
+      if game.board.isCheck(game.current_player)[0]:
+        return -MATE_SCORE + ply
+      return 0
+    if best_score <= original_alpha:
+      flag = UPPER_BOUND
+    elif best_score >= beta:
+      flag = LOWER_BOUND
+    else:
+      flag = EXACT
+    self.table.store(key, depth, best_score, flag, best_move)
+    return best_score
+
+  def quiescence(self, game, alpha, beta):
+    """
+    Search the captures of a leaf, so that it is not evaluated in the middle
+    of an exchange. Captures losing material by static exchange evaluation are
+    not searched
+    Input:
+      game: Object of class ChessGame
+      alpha: Int
+      beta: Int
+    Return:
+      Int                           - Score from the view of the player to move
+    """
+    best_score = self.evaluate(game)
+    if best_score >= beta:
+      return best_score
+    alpha = max(alpha, best_score)
+    for move in MovePicker(game, captures_only=True):
+      self.nodes += 1
+      if self.isStopped():
+        raise SearchStopped()
+      child, retval = self.playMove(game, move)
+      if retval in [3, 4]:
+        return MATE_SCORE
+      if retval == 5:
+        score = 0
+      else:
+        score = -self.quiescence(child, -beta, -alpha)
+      if score > best_score:
+        best_score = score
+        alpha = max(alpha, score)
+        if alpha >= beta:
+          break
+    return best_score
+
+  def storeKiller(self, move, ply, depth):
+    """
+    Remember a quiet move that caused a cut-off
+    Input:
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+      ply: Int
+      depth: Int
+    Return:
+    """
+    killers = self.killers[ply]
+    if move not in killers:
+      killers.insert(0, move)
+      del killers[2:]
+    self.history[(move[0], move[1])] = self.history.get((move[0], move[1]), 0) + depth*depth
+
+  def getMove(self, game, time_limit=None, depth=None, stop_event=None):
+    """
+    Find the best move for the current player by iterative deepening. The
+    search ends at the given depth, after the time limit, or when stop() is
+    called or the stop event is set
+    Input:
+      game: Object of class ChessGame
+      time_limit: Float             - Seconds, no limit if None
+      depth: Int                    - Maximum depth, self.depth if None
+      stop_event: threading.Event   - Owned by the caller, which can set it even before
+                                      the search started; a new one if None
+    Return:
+      Tuple of (Tuple of Int, Tuple of Int, String) - start, destination and promotion,
+                                                      None if there is no valid move
+    """
+    start_time = time.perf_counter()
+    self.stop_event = stop_event if stop_event is not None else threading.Event()
+    self.deadline = None if time_limit is None else start_time + time_limit
+    self.nodes = 0
+    self.stats = {}
+    self.killers = []
+    self.history = {}
+    moves = self.orderMoves(game, game.getLegalMoves(), None)
+    if len(moves) == 0:
+      return None
+    best_move = moves[0]
+    for iteration_depth in range(1, (depth or self.depth) + 1):
+      try:
+        best_move, best_score = self.searchRoot(game, moves, iteration_depth)
+      except SearchStopped:
+        break
+      # Search the best move first in the next iteration
+      moves.remove(best_move)
+      moves.insert(0, best_move)
+      elapsed = time.perf_counter() - start_time
+      self.stats = {
+        'depth': iteration_depth,
+        'nodes': self.nodes,
+        'time': elapsed,
+        'nodes_per_second': self.nodes / elapsed if elapsed > 0 else 0,
+        'score': best_score,
+        'move': best_move,
+      }
+      if self.info_callback is not None:
+        self.info_callback(self.stats)
+    return best_move
+
+  def searchRoot(self, game, moves, depth):
+    """
+    Search all moves of the root position to the given depth
+    Input:
+      game: Object of class ChessGame
+      moves: List of Tuple of (Tuple of Int, Tuple of Int, String)
+      depth: Int
+    Return:
+      Tuple of (Tuple of Int, Tuple of Int, String) and Int - best move and its score
+    """
+    # Search the first move alone, its score bounds the search of all others
+    best_move = moves[0]
+    best_score = self.searchRootMove(game, best_move, -INFINITY, depth)
+    if self.processes > 1:
+      if self.pool is None:
+        self.pool = multiprocessing.Pool(self.processes, initializer=initWorker,
+            initargs=(self.table.name, self.table.size))
+      fen = game.getFEN()
+      pending = self.pool.map_async(searchRootMoveWorker,
+          [(fen, move, best_score, depth) for move in moves[1:]])
+      while not pending.ready():
+        pending.wait(0.005)
+        if self.isStopped():
+          # The workers cannot be interrupted, start fresh ones next time
+          self.pool.terminate()
+          self.pool = None
+          raise SearchStopped()
+      results = pending.get()
+    else:
+      results = []
+      for move in moves[1:]:
+        nodes = self.nodes
+        results.append((self.searchRootMove(game, move, best_score, depth), self.nodes - nodes))
+        self.nodes = nodes
+    for move, (score, nodes) in zip(moves[1:], results):
+      self.nodes += nodes
+      if score > best_score:
+        best_score = score
+        best_move = move
+    return best_move, best_score
+
+  def searchRootMove(self, game, move, alpha, depth):
+    """
+    Search a single move of the root position
+    Input:
+      game: Object of class ChessGame
+      move: Tuple of (Tuple of Int, Tuple of Int, String)
+      alpha: Int                    - Score that has to be beaten
+      depth: Int
+    Return:
+      Int                           - Score from the view of the player at the root
+    """
+    child, retval = self.playMove(game, move)
+    if retval in [3, 4]:
+      return MATE_SCORE - 1
+    if retval == 5:
+      return 0
+    return -self.search(child, depth - 1, -INFINITY, -alpha, 1)
+
+  def isStopped(self):
+    """Check if the search has to stop, because it was stopped or the time is over"""
+    return self.stop_event.is_set() or self.deadline is not None and time.perf_counter() > self.deadline
+
+  def stop(self):
+    """Stop a running search, getMove() returns the best move found so far"""
+    self.stop_event.set()
+
+  def close(self):
+    """Shut down the worker processes and free the transposition table"""
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool = None
+    self.table.close()
+
+worker_ai = None
+
+def initWorker(table_name, table_size):
+  """
+  Set up the search of a worker process, attached to the shared transposition table
+  Input:
+    table_name: String
+    table_size: Int
+  Return:
+  """
+  global worker_ai
+  worker_ai = SearchAI(table=TranspositionTable(table_size, table_name))
+
+def searchRootMoveWorker(task):
+  """
+  Search a root move in a worker process
+  Input:
+    task: Tuple of String, Tuple, Int and Int - FEN of the root position, the move, alpha and depth
+  Return:
+    Tuple of Int                    - score and number of searched nodes
+  """
+  fen, move, alpha, depth = task
+  game = ChessGame(fen)
+  worker_ai.nodes = 0
+  score = worker_ai.searchRootMove(game, move, alpha, depth)
+  return score, worker_ai.nodes
@@ -0,0 +1,220 @@
+"""
+Adapter for the Universal Chess Interface (UCI), so that GUIs and other
+engines can play against an AI on top of ChessGame
+"""
+
+import sys
+import threading
+
+from game.ChessGame import ChessGame, coordinatesToMove, moveToCoordinates
+from game.SearchAI import SearchAI, MATE_SCORE
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+MAX_DEPTH = 64
+
+class UCIAdapter:
+  """
+  Speaks UCI on the given streams. The AI has to provide
+  getMove(game, time_limit, depth, stop_event), which returns once the
+  threading.Event is set, and may provide an info_callback attribute which
+  is called with the stats of every iteration
+  """
+  def __init__(self, ai=None, input_stream=sys.stdin, output_stream=sys.stdout):
+    if ai is None:
+      ai = SearchAI()
+    self.ai = ai
+    self.input_stream = input_stream
+    self.output_stream = output_stream
+    self.fen = START_FEN
+    self.moves = []
+    self.game = ChessGame()
+    self.search_thread = None
+    self.stop_event = None
+    if hasattr(ai, 'info_callback'):
+      ai.info_callback = self.sendInfo
+
+  def send(self, line):
+    """
+    Send a line to the GUI
+    Input:
+      line: String
+    Return:
+    """
+    self.output_stream.write(line + '\n')
+    self.output_stream.flush()
+
+  def run(self):
+    """
+    Handle commands until 'quit' is received or the input ends
+    Input:
+    Return:
+    """
+    for line in self.input_stream:
+      if not self.handle(line):
+        break
+    self.stopSearch()
+
+  def handle(self, line):
+    """
+    Handle a single command
+    Input:
+      line: String
+    Return:
+      Bool                          - False after 'quit'
+    """
+    tokens = line.split()
+    if len(tokens) == 0:
+      return True
+    command = tokens[0]
+    if command == 'uci':
+      self.send('id name ChessAIGame')
+      self.send('id author ChessAIGame')
+      self.send('uciok')
+    elif command == 'isready':
+      self.send('readyok')
+    elif command == 'ucinewgame':
+      self.stopSearch()
+      self.setPosition(START_FEN, [], reuse=False)
+    elif command == 'position':
+      self.stopSearch()
+      self.handlePosition(tokens[1:])
+    elif command == 'go':
+      self.stopSearch()
+      self.go(tokens[1:])
+    elif command == 'stop':
+      self.stopSearch()
+    elif command == 'quit':
+      return False
+    return True
+
+  def handlePosition(self, tokens):
+    """
+    Handle the arguments of the 'position' command
+    Input:
+      tokens: List of String        - e.g. ['startpos', 'moves', 'e2e4']
+    Return:
+    """
+    if 'moves' in tokens:
+      moves = tokens[tokens.index('moves') + 1:]
+      tokens = tokens[:tokens.index('moves')]
+    else:
+      moves = []
+    if tokens[0] == 'fen':
+      fen = ' '.join(tokens[1:])
+    else:
+      fen = START_FEN
+    self.setPosition(fen, moves)
+
+  def setPosition(self, fen, moves, reuse=True):
+    """
+    Set up the position. If it only differs from the current one by moves
+    added to or removed from the end, these are played or undone instead
+    of replaying the whole game
+    Input:
+      fen: String
+      moves: List of String         - Moves in coordinate notation
+      reuse: Bool                   - Allow updating the current game
+    Return:
+    """
+    if reuse and fen == self.fen and moves[:len(self.moves)] == self.moves:
+      new_moves = moves[len(self.moves):]
+    elif reuse and fen == self.fen and self.moves[:len(moves)] == moves:
+      while len(self.moves) > len(moves):
+        self.game.undo()
+        self.moves.pop()
+      new_moves = []
+    else:
+      self.fen = fen
+      self.game = ChessGame(fen)
+      self.moves = []
+      new_moves = moves
+    for move_str in new_moves:
+      start, destination, promotion_str = coordinatesToMove(move_str)
+      if self.game.moveCoordinates(start, destination, promotion_str) == -1:
+        self.send('info string invalid move ' + move_str)
+        break
+      self.moves.append(move_str)
+
+  def getTimeLimit(self, options):
+    """
+    Get the time to spend on the move
+    Input:
+      options: Dict of String to Int - Arguments of the 'go' command
+    Return:
+      Float                         - Seconds, None if unlimited
+    """
+    if 'movetime' in options:
+      return options['movetime'] / 1000
+    remaining = options.get('wtime' if self.game.current_player == 0 else 'btime')
+    if remaining is None:
+      return None
+    increment = options.get('winc' if self.game.current_player == 0 else 'binc', 0)
+    return max(remaining / 30 + increment * 3 / 4, 10) / 1000
+
+  def go(self, tokens):
+    """
+    Start searching the current position in the background
+    Input:
+      tokens: List of String        - Arguments of the 'go' command
+    Return:
+    """
+    options = {}
+    for name, value in zip(tokens, tokens[1:]):
+      if name in ['wtime', 'btime', 'winc', 'binc', 'movetime', 'depth']:
+        options[name] = int(value)
+    time_limit = self.getTimeLimit(options)
+    if 'depth' in options:
+      depth = options['depth']
+    elif time_limit is not None or 'infinite' in tokens:
+      depth = MAX_DEPTH
+    else:
+      depth = None
+    # Created before the thread starts, so that a 'stop' arriving right away is not lost
+    self.stop_event = threading.Event()
+    self.search_thread = threading.Thread(target=self.search, args=(time_limit, depth, self.stop_event),
+        daemon=True)
+    self.search_thread.start()
+
+  def search(self, time_limit, depth, stop_event):
+    """
+    Search the current position and send the best move
+    Input:
+      time_limit: Float
+      depth: Int
+      stop_event: threading.Event   - Set to stop the search
+    Return:
+    """
+    move = self.ai.getMove(self.game, time_limit, depth, stop_event)
+    if move is None:
+      self.send('bestmove 0000')
+    else:
+      self.send('bestmove ' + moveToCoordinates(*move))
+
+  def stopSearch(self):
+    """
+    Stop the running search, which sends its best move before this returns
+    Input:
+    Return:
+    """
+    if self.search_thread is None:
+      return
+    self.stop_event.set()
+    self.search_thread.join()
+    self.search_thread = None
+
+  def sendInfo(self, stats):
+    """
+    Send the stats of a finished iteration
+    Input:
+      stats: Dict (see SearchAI.stats)
+    Return:
+    """
+    score = stats['score']
+    if abs(score) > MATE_SCORE - 1000:
+      plies = MATE_SCORE - abs(score)
+      score_str = 'mate %d' % ((plies + 1) // 2 if score > 0 else -((plies + 1) // 2))
+    else:
+      score_str = 'cp %d' % (100 * score)
+    self.send('info depth %d score %s nodes %d nps %d time %d pv %s'
+        % (stats['depth'], score_str, stats['nodes'], stats['nodes_per_second'],
+          1000 * stats['time'], moveToCoordinates(*stats['move'])))
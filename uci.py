@@ -0,0 +1,7 @@
+from game.UCI import UCIAdapter
+
+adapter = UCIAdapter()
+try:
+  adapter.run()
+finally:
+  adapter.ai.close()